@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+''' Startup and navigation benchmarks of qfortune on synthetic corpora.
+
+Every corpus size is measured in its own process, with its own HOME, so
+peak memory is not shared between sizes and no real cookie or cache is
+touched. Results are printed (or saved) as JSON so runs of two commits
+can be compared with --compare.
+
+    QT_QPA_PLATFORM=offscreen python3 bench/benchmark.py --sizes 1000,100000
+'''
+
+import os
+import sys
+import json
+import time
+import codecs
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+LANGS = ["en", "es", "fr"]
+WORDS = ["fortune", "cookie", "amigo", "canción", "señor", "vida", "time",
+         "the", "de", "la", "que", "wisdom", "corazón", "été", "über",
+         "never", "always", "mañana", "paz", "love", "pensée", "día"]
+
+
+def makeCookie(rand):
+    lines = []
+    for i in range(rand.choice((1, 1, 1, 2, 3, 6))):
+        lines.append(" ".join(rand.choice(WORDS)
+                              for j in range(rand.randint(3, 14))))
+    if rand.random() < 0.3:
+        lines.append("\t\t-- " + rand.choice(WORDS).capitalize())
+    return("\n".join(lines))
+
+
+def makeCorpus(base, ncookies, seed=0):
+    ''' Writes ncookies cookies under base/lang and base/lang/off, in files
+    of about 2000 cookies, a tenth of them offensive and rot13 encoded. '''
+    rand = random.Random(seed)
+    nfiles = max(len(LANGS) * 2, ncookies // 2000)
+    per = ncookies // nfiles
+    for i in range(nfiles):
+        lang = LANGS[i % len(LANGS)]
+        offensive = i % 10 == 9
+        path = os.path.join(base, lang, "off" if offensive else "")
+        os.makedirs(path, exist_ok=True)
+        count = per + (ncookies - per * nfiles if i == 0 else 0)
+        cookies = [makeCookie(rand) for j in range(count)]
+        if offensive:
+            cookies = [codecs.encode(c, "rot13") for c in cookies]
+        with open(os.path.join(path, "file" + str(i)), "w") as f:
+            f.write("\n%\n".join(cookies) + "\n%\n")
+
+
+def peakRSS():
+    ''' Peak resident memory of this process, in KiB '''
+    return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def latency(f, times):
+    ''' Runs f times times and returns latency statistics in ms '''
+    samples = []
+    for i in range(times):
+        t = time.perf_counter()
+        f()
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return({"p50": samples[len(samples) // 2],
+            "p95": samples[int(len(samples) * 0.95)],
+            "max": samples[-1]})
+
+
+def since(t):
+    return((time.perf_counter() - t) * 1000)
+
+
+def measure(ncookies):
+    ''' Benchmarks one corpus size. Must run with HOME set to an empty
+    temporary directory. '''
+    sys.path.insert(0, SRC)
+    import config
+    base = config.FORTUNE_DIRS[1]  # Custom fortunes, under HOME
+    makeCorpus(base, ncookies)
+    result = {"cookies": ncookies}
+
+    import cookiestore
+    for run in "cold", "warm":
+        t = time.perf_counter()
+        store = cookiestore.loadCorpus([base], config.CACHE_DIR)
+        result["load_corpus_" + run + "_ms"] = since(t)
+    store.close()
+
+    t = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(SRC, "qfortune.py"),
+                    "--print"], check=True, stdout=subprocess.DEVNULL)
+    result["cli_print_ms"] = since(t)
+    result["rss_headless_kib"] = peakRSS()
+
+    from PyQt5.QtWidgets import QApplication
+    import window
+    window.FORTUNE_DIRS = [base]  # Leave installed cookies out
+    app = QApplication([sys.argv[0]])
+
+    t = time.perf_counter()
+    w = window.MainWindow()
+    result["window_construction_ms"] = since(t)
+    w.show()
+    while w.index < 0 and not w.loader.isFinished():
+        app.processEvents()
+    app.processEvents()
+    w.textEdit.viewport().repaint()
+    result["first_paint_ms"] = since(t)
+    w.loader.wait()
+    app.processEvents()
+    result["load_dir_ms"] = since(t)
+    result["navigable"] = w.nepigrams
+
+    result["next_cookie_ms"] = latency(w.nextCookie, 1000)
+    result["prev_cookie_ms"] = latency(w.prevCookie, 1000)
+    result["show_cookie_ms"] = latency(w.showCookie, 1000)
+    result["refresh_interface_ms"] = latency(w.refreshInterface, 1000)
+
+    def save():
+        w.nextCookie()
+        t = time.perf_counter()
+        w.saveCookie()
+        samples.append(since(t))
+    samples = []
+    for i in range(50):
+        save()
+    samples.sort()
+    result["save_cookie_ms"] = {"p50": samples[len(samples) // 2],
+                                "max": samples[-1]}
+
+    w.close()
+    result["rss_peak_kib"] = peakRSS()
+    return(result)
+
+
+def compare(old, new):
+    ''' Prints the change of every number between two result files '''
+    olds = dict((r["cookies"], r) for r in old["results"])
+    for r in new["results"]:
+        o = olds.get(r["cookies"])
+        if not o:
+            continue
+        print("== " + str(r["cookies"]) + " cookies")
+        for key, value in r.items():
+            if isinstance(value, dict):
+                value, before = value.get("p50"), o.get(key, {}).get("p50")
+                key += " p50"
+            else:
+                before = o.get(key)
+            if before and value is not None and key != "cookies":
+                print("%-28s %12.2f %12.2f %+7.1f%%" % (
+                    key, before, value, (value - before) * 100 / before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qfortune benchmarks")
+    parser.add_argument("--sizes", default="1000,100000",
+                        help="comma separated corpus sizes, in cookies")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--compare", metavar="OLD",
+                        help="compare with the JSON results of another run")
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        json.dump(measure(args.one), sys.stdout)
+        return(0)
+
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as home:
+            env["HOME"] = home
+            out = subprocess.run([sys.executable, __file__, "--one",
+                                  str(size)], env=env, check=True,
+                                 stdout=subprocess.PIPE)
+        results.append(json.loads(out.stdout.decode()))
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                cwd=SRC, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL
+                                ).stdout.decode().strip()
+    except OSError:
+        commit = None
+    report = {"commit": commit, "python": sys.version.split()[0],
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
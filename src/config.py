@@ -0,0 +1,52 @@
+''' Program information and standard paths, shared by all modules. '''
+
+import os
+import gettext
+
+PROGRAM_NAME = "QFortune"
+EXECUTABLE_NAME = "qfortune"
+
+gettext.translation("qfortune", localedir="/usr/share/locale",
+                    fallback=True).install()
+
+DESCRIPTION = _("A pyQt5 interface for reading fortune cookies")
+VERSION = "0.5a"
+AUTHOR = "Manuel Domínguez López"  # See AUTHORS file
+MAIL = "mdomlop@gmail.com"
+SOURCE = "https://github.com/mdomlop/qfortune"
+LICENSE = "GPLv3+"  # Read LICENSE file.
+
+COPYRIGHT = '''
+Copyright: 2017 Manuel Domínguez López <mdomlop@gmail.com>
+License: GPL-3.0+
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ .
+ This package is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+ .
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <https://www.gnu.org/licenses/>.
+ .
+ On Debian systems, the complete text of the GNU General
+ Public License version 3 can be found in "/usr/share/common-licenses/GPL-3".
+'''
+
+HOME = os.getenv("HOME")
+FORTUNE_DIRS = ["/usr/share/" + EXECUTABLE_NAME + "/fortunes",  # App
+                os.path.join(HOME, ".config", EXECUTABLE_NAME,
+                             "fortunes")]  # Custom
+SAVE_BASE = os.path.join(HOME, ".config", EXECUTABLE_NAME)
+SAVE_FILE = os.path.join(SAVE_BASE, "favorites.cookies")  # Export
+FAVORITES_DB = os.path.join(SAVE_BASE, "favorites.db")
+CACHE_DIR = os.path.join(HOME, ".cache", EXECUTABLE_NAME)
+CORPUS_DB = os.path.join(CACHE_DIR, "corpus.db")  # For --db
+RUNTIME_DIR = os.getenv("XDG_RUNTIME_DIR") or CACHE_DIR
+SERVER_SOCKET = os.path.join(RUNTIME_DIR, EXECUTABLE_NAME + ".sock")
+SERVER_PORT = 8117  # HTTP, on the loopback interface only
+SHORT_LENGTH = 160  # Bytes of the longest short cookie, as in fortune(6)
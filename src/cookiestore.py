@@ -0,0 +1,483 @@
+''' Compact storage for fortune cookies.
+
+Cookies are not kept as strings. Every cookie is a row of four arrays
+(file number, offset, length and flags) and its text is decoded from the
+memory mapped cookie file only when it is requested.
+
+This module does not need Qt, so it can be used from scripts.
+'''
+
+import os
+import sys
+import mmap
+import time
+import bisect
+import hashlib
+from array import array
+
+import strfile
+import packfile
+import corpuscache
+import profiling
+
+OFFENSIVE = 0x1  # Cookie comes from an off/ directory
+SAVED = 0x2  # Cookie comes from the favorites file or was saved
+ROTATED = 0x4  # Cookie is rot13 encoded
+
+ROT13 = str.maketrans(
+    "ABCDEFGHIJKLMabcdefghijklmNOPQRSTUVWXYZnopqrstuvwxyz",
+    "NOPQRSTUVWXYZnopqrstuvwxyzABCDEFGHIJKLMabcdefghijklm")
+
+
+def decrypt(s):  # Unix offensive fortunes are rot13 encoded
+    return(str.translate(s, ROT13))
+
+
+def contentId(text):
+    ''' 64 bit id of a cookie text. Changes in whitespace do not count. '''
+    text = " ".join(text.split()).encode()
+    return(int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(),
+                          "little"))
+
+
+def lengthOrder(lengths):
+    ''' Returns the numbers of the cookies sorted by their lengths '''
+    return(array("I", sorted(range(len(lengths)), key=lengths.__getitem__)))
+
+
+def contentIds(path, table, times=None):
+    ''' Returns the content ids, the text lengths and the length order of
+    the cookies of a file, reading it once by chunks. The seconds spent
+    decrypting are added to times["decrypt"] if times is given. '''
+    ids = array("Q")
+    lengths = array("I")
+    with packfile.openCookies(path) as f:
+        for offset, length, raw in strfile.records(f, table.delim):
+            lengths.append(length)
+            text = raw.decode(errors="replace")
+            if table.isRotated():
+                if times is None:
+                    text = decrypt(text)
+                else:
+                    start = time.perf_counter()
+                    text = decrypt(text)
+                    times["decrypt"] = (times.get("decrypt", 0)
+                                        + time.perf_counter() - start)
+            ids.append(contentId(text))
+    if len(ids) != table.numstr:
+        raise OSError(path + ": changed while being read")
+    return(ids, lengths, lengthOrder(lengths))
+
+
+def cookieDirs(bases):
+    ''' Returns path, lang and offensive of the base/lang and
+    base/lang/off directories of bases that exist. '''
+    found = []
+    for base in bases:
+        if os.path.isdir(base):
+            try:
+                langs = os.listdir(base)
+            except OSError:
+                continue  # Skip unreadable directory
+            for lang in langs:
+                path = os.path.join(base, lang)
+                for i in (path, lang, False), (os.path.join(path, 'off'),
+                                               lang, True):
+                    if os.path.isdir(i[0]):
+                        found.append(i)
+    return(found)
+
+
+def findFiles(bases):
+    ''' Returns path, lang and offensive of every cookie file found in the
+    base/lang and base/lang/off directories of bases. '''
+    found = []
+    for path, lang, offensive in cookieDirs(bases):
+        try:
+            l = os.listdir(path)
+        except OSError:
+            l = []
+        for f in l:
+            if f.endswith(".dat"):
+                continue  # Offset tables, not cookies
+            f = os.path.join(path, f)
+            if os.path.isfile(f):
+                found.append((f, lang, offensive))
+    return(found)
+
+
+def loadFiles(files, cachedir, cache=None, profile=None):
+    ''' Yields path, offset table, lang, offensive and saved of every
+    readable file of files, a list of (path, lang, offensive, saved).
+    Tables come from cache when it is given and they are still valid.
+    Reading times go to profile if it is given. '''
+    for path, lang, offensive, saved in files:
+        if not os.path.isfile(path):
+            continue
+        start = parsed = time.perf_counter()
+        times = {}
+        table = cache.get(path) if cache else None
+        cached = table is not None
+        if table is None:
+            try:
+                table = packfile.load(path, os.path.join(cachedir, "dat"),
+                                      offensive)
+                parsed = time.perf_counter()
+                table.ids, table.lengths, table.order = contentIds(
+                    path, table, times)
+            except OSError:
+                continue
+            if cache:
+                cache.put(path, table)
+        if profile is not None:
+            end = time.perf_counter()
+            profile.addFile(path, table, parsed - start, end - parsed,
+                            times.get("decrypt", 0), cached)
+        yield(path, table, lang, offensive, saved)
+
+
+def loadCorpus(bases, cachedir, extra=[], profile=None):
+    ''' Returns a store with all the cookie files under bases plus the
+    extra ones, a list of (path, lang, offensive, saved). The times of
+    every phase go to profile if it is given. '''
+    if profile is None:
+        profile = profiling.Profile()
+    cache = corpuscache.CorpusCache(os.path.join(cachedir, "corpus.cache"))
+    with profile.phase("cache load"):
+        cache.load()
+    with profile.phase("discovery"):
+        files = [f + (False,) for f in findFiles(bases)] + extra
+    store = CookieStore()
+    with profile.phase("parse"):
+        for path, table, lang, offensive, saved in loadFiles(
+                files, cachedir, cache, profile):
+            store.addFile(path, table, lang, offensive, saved)
+    with profile.phase("cache save"):
+        cache.save()
+    return(store)
+
+
+class CookieStore:
+    ''' All the cookies of a set of cookie files.
+
+    Cookies with the same text (see contentId) in several files are kept
+    as separate rows, but only the first of them is in unique. unique,
+    ids and copies are only made when first asked, for the files added
+    since.
+
+    Cookie numbers never change. The rows of a removed file are left
+    unused and its path becomes None. '''
+    def __init__(self):
+        self.files = []  # path, lang, offensive, saved and delimiter
+        self.maps = {}  # Memory maps of the files already read
+        self.filestart = array("I")  # First cookie of every file
+        self.filecount = array("I")  # Number of cookies of every file
+        self.fileid = array("I")
+        self.offset = array("I")
+        self.length = array("I")  # Bytes up to the next cookie
+        self.flags = array("B")
+        self.cid = array("Q")  # Content id of every cookie
+        self._ids = {}  # Content id: its place in unique
+        self._copies = {}  # Content id: all its cookies, if more than one
+        self._unique = array("I")  # First cookie of every content id
+        self.indexed = 0  # Files already in unique
+        self.views = {}  # File number and length limits: its first cookies
+                         # and those of its texts first found elsewhere
+        self.chunks = {}  # File number: member index, for packs
+        self.textlen = array("I")  # Bytes of the text of every cookie
+        self.bylength = {}  # File number: text lengths of its cookies,
+                            # sorted, and their local numbers in that order
+
+    def __len__(self):
+        return(len(self.flags))
+
+    @property
+    def unique(self):
+        self.dedup()
+        return(self._unique)
+
+    @property
+    def ids(self):
+        self.dedup()
+        return(self._ids)
+
+    @property
+    def copies(self):
+        self.dedup()
+        return(self._copies)
+
+    def dedup(self):
+        ''' Adds the cookies of the files added since the last time to
+        unique, ids and copies '''
+        ids, copies, unique, cid = self._ids, self._copies, self._unique, \
+            self.cid
+        for fileid in range(self.indexed, len(self.files)):
+            first = self.filestart[fileid]
+            for n in range(first, first + self.filecount[fileid]):
+                slot = ids.setdefault(cid[n], len(unique))
+                if slot == len(unique):
+                    unique.append(n)
+                else:
+                    copies.setdefault(cid[n], [unique[slot]]).append(n)
+        self.indexed = len(self.files)
+
+    def addFile(self, path, table, lang=None, offensive=False, saved=False):
+        ''' Adds all the cookies in the offset table of path. Returns the
+        number of the first of them. '''
+        first = len(self)
+        n = len(self.files)
+        self.files.append((path, lang, offensive, saved, table.delim))
+        self.filestart.append(first)
+        self.filecount.append(table.numstr)
+
+        flags = 0
+        if offensive:
+            flags |= OFFENSIVE
+        if saved:
+            flags |= SAVED
+        if table.isRotated():
+            flags |= ROTATED
+
+        offsets = table.offsets
+        count = table.numstr
+        self.fileid.extend(array("I", (n,)) * count)
+        self.offset.extend(offsets[:count])
+        self.length.extend(offsets[i + 1] - offsets[i] for i in range(count))
+        self.flags.extend(array("B", (flags,)) * count)
+
+        if table.chunks:
+            self.chunks[n] = table.chunks
+        ids, lengths, order = table.ids, table.lengths, table.order
+        if any(a is None or len(a) != count for a in (ids, lengths, order)):
+            ids, lengths, order = table.ids, table.lengths, table.order = \
+                contentIds(path, table)
+        self.cid.extend(ids)
+        self.textlen.extend(lengths)
+        self.bylength[n] = (array("I", map(lengths.__getitem__, order)),
+                            order)
+        return(first)
+
+    def removeFile(self, fileid):
+        ''' Removes the cookies of a file. A text still found in other
+        files keeps its place in unique; the place of a text that is gone
+        is taken by the last one. Returns the changed places of unique as
+        a dict of old place: new place or None if gone. '''
+        moved = {}
+        origin = {}  # Current place: old place, of the moved ones
+        unique = self._unique
+        first = self.filestart[fileid]
+        count = self.filecount[fileid] if fileid < self.indexed else 0
+        for n in range(first, first + count):
+            cid = self.cid[n]
+            slot = self._ids[cid]
+            copies = self._copies.get(cid)
+            if copies:
+                copies.remove(n)
+                if unique[slot] == n:
+                    unique[slot] = copies[0]
+                if len(copies) == 1:
+                    del self._copies[cid]
+                continue
+            del self._ids[cid]
+            moved[origin.pop(slot, slot)] = None
+            last = len(unique) - 1
+            if slot != last:
+                unique[slot] = unique[last]
+                self._ids[self.cid[unique[slot]]] = slot
+                old = origin.pop(last, last)
+                moved[old] = slot
+                origin[slot] = old
+            unique.pop()
+
+        self.filecount[fileid] = 0
+        self.files[fileid] = (None,) + self.files[fileid][1:]
+        self.views.clear()  # First cookies may be others now
+        self.chunks.pop(fileid, None)
+        self.bylength.pop(fileid, None)
+        self.closeMap(fileid)
+        return(moved)
+
+    def fileId(self, path):
+        ''' Returns the number of the file path, or None if not loaded '''
+        for i in range(len(self.files) - 1, -1, -1):
+            if self.files[i][0] == path:
+                return(i)
+        return(None)
+
+    def map(self, fileid):
+        ''' Returns the memory map of a file, opening it if needed. Packs
+        get a packfile.Pack, which is sliced the same way. '''
+        mm = self.maps.get(fileid)
+        if mm is None:
+            path = self.files[fileid][0]
+            if fileid in self.chunks:
+                mm = packfile.Pack(path, self.chunks[fileid])
+            else:
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[fileid] = mm
+        return(mm)
+
+    def closeMap(self, fileid):
+        ''' Closes the map of a file that changed, so the next cookies are
+        read from what it has now '''
+        mm = self.maps.pop(fileid, None)
+        if mm is not None:
+            mm.close()
+
+    def raw(self, n):
+        ''' Returns the bytes of cookie n, as stored in its file. A cookie
+        past the end of a file cut since it was mapped is empty. '''
+        fileid = self.fileid[n]
+        start = self.offset[n]
+        end = start + self.length[n]
+        try:
+            mm = self.map(fileid)
+            if isinstance(mm, mmap.mmap) and mm.size() < end:
+                return(b"")  # Reading it would be a SIGBUS
+        except (OSError, ValueError):
+            return(b"")
+        return(strfile.cut(mm[start:end], self.files[fileid][4]))
+
+    def text(self, n):
+        ''' Returns the decoded text of cookie n '''
+        text = self.raw(n).decode(errors="replace").replace("\r\n", "\n")
+        if self.flags[n] & ROTATED:
+            text = decrypt(text)
+        return(text)
+
+    def path(self, n):
+        return(self.files[self.fileid[n]][0])
+
+    def sources(self, n):
+        ''' Returns the paths of all the files with the text of cookie n '''
+        copies = self.copies.get(self.cid[n], [n])
+        return([self.path(c) for c in copies])
+
+    def originals(self, numbers):
+        ''' Returns the sorted first cookies of the texts of numbers that
+        are still in the store '''
+        unique, ids, cid = self.unique, self.ids, self.cid
+        return(sorted(set(unique[ids[cid[n]]] for n in numbers
+                          if cid[n] in ids)))
+
+    def fileView(self, fileid, shortmax=None, longmin=None):
+        ''' Returns the sorted first cookies of the texts of a file that fit
+        the length limits: those in the file and those in other files.
+        Made once for every file and limits. '''
+        key = (fileid, shortmax, longmin)
+        view = self.views.get(key)
+        if view is not None:
+            return(view)
+        first = self.filestart[fileid]
+        if shortmax is None and longmin is None:
+            unique, ids, cid = self.unique, self.ids, self.cid
+            own, others = array("I"), set()
+            for n in range(first, first + self.filecount[fileid]):
+                o = unique[ids[cid[n]]]
+                if o == n:
+                    own.append(n)
+                else:
+                    others.add(o)
+            view = (own, array("I", sorted(others)))
+        else:  # Those of the whole file with the lengths of lengthRange
+            own, others = self.fileView(fileid)
+            order, start, end = self.lengthRange(fileid, shortmax, longmin)
+            fit = set(map(first.__add__, order[start:end]))
+            view = (array("I", sorted(fit.intersection(own))),
+                    array("I", (n for n in others
+                                if fitsLength(self, n, shortmax, longmin))))
+        self.views[key] = view
+        return(view)
+
+    def view(self, files, shortmax=None, longmin=None):
+        ''' Returns the sorted first cookies of the texts found in any of
+        the files, a union of their views, that fit the length limits '''
+        found = array("I")
+        others = set()
+        files = sorted(files)
+        for fileid in files:  # Their own cookies come already sorted
+            own, elsewhere = self.fileView(fileid, shortmax, longmin)
+            found.extend(own)
+            others.update(elsewhere)
+        selected = set(files)
+        others = sorted(n for n in others if self.fileid[n] not in selected)
+        if others:  # Two sorted runs, merged by sorted()
+            found = array("I", sorted(found + array("I", others)))
+        return(found)
+
+    def lengthRange(self, fileid, shortmax=None, longmin=None):
+        ''' Returns the local numbers of the cookies of a file sorted by
+        length, and the start and end of those that fit the limits of
+        fitsLength. A couple of bisections. '''
+        lengths, order = self.bylength.get(fileid, (array("I"), array("I")))
+        start = 0 if longmin is None else bisect.bisect_right(lengths,
+                                                              longmin)
+        end = len(lengths) if shortmax is None \
+            else bisect.bisect_right(lengths, shortmax)
+        return(order, start, max(start, end))
+
+    def countLength(self, fileid, shortmax=None, longmin=None):
+        order, start, end = self.lengthRange(fileid, shortmax, longmin)
+        return(end - start)
+
+    def countUnique(self):
+        return(len(self.unique))
+
+    def langs(self):
+        return(sorted(set(f[1] for f in self.files
+                          if f[0] is not None and f[1])))
+
+    def lang(self, n):
+        return(self.files[self.fileid[n]][1])
+
+    def isOffensive(self, n):
+        return(bool(self.flags[n] & OFFENSIVE))
+
+    def selectFiles(self, offensive=None, lang=None, path=None):
+        ''' Returns the numbers of the files that match. offensive is False
+        for no offensive files, True for only them or None for all. '''
+        return([i for i, f in enumerate(self.files)
+                if f[0] is not None
+                and (offensive is None or f[2] == offensive)
+                and (lang is None or f[1] == lang)
+                and (path is None or f[0] == path)])
+
+    def footprint(self):
+        ''' Returns about how many bytes every part of the store takes '''
+        size = sys.getsizeof
+        arrays = (self.filestart, self.filecount, self.fileid, self.offset,
+                  self.length, self.flags, self.cid, self._unique,
+                  self.textlen)
+        parts = {
+            "rows": sum(size(a) for a in arrays),
+            "ids": size(self._ids) + sum(size(k) + size(v)
+                                         for k, v in self._ids.items()),
+            "copies": size(self._copies) + sum(
+                size(k) + size(v) + sum(size(n) for n in v)
+                for k, v in self._copies.items()),
+            "views": size(self.views) + sum(size(a) + size(b) for a, b
+                                            in self.views.values()),
+            "lengths": size(self.bylength) + sum(
+                size(a) + size(b) for a, b in self.bylength.values()),
+            "files": size(self.files) + sum(size(f) + size(f[0] or "")
+                                            for f in self.files)}
+        parts["total"] = sum(parts.values())
+        return(parts)
+
+    def close(self):
+        for mm in self.maps.values():
+            mm.close()
+        self.maps.clear()
+
+
+def fitsLength(store, n, shortmax=None, longmin=None):
+    ''' Classic fortune -s and -l: up to shortmax or more than longmin
+    bytes long '''
+    length = store.textlen[n]
+    if shortmax is not None and length > shortmax:
+        return(False)
+    if longmin is not None and length <= longmin:
+        return(False)
+    return(True)
+
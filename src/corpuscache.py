@@ -0,0 +1,154 @@
+''' On-disk cache of the offset tables of a whole set of cookie files.
+
+All tables are kept in a single binary file, so a warm start costs one
+read plus one stat() per cookie file. A table is only trusted while the
+path, modification time, size and inode of its cookie file are the same
+as when it was stored.
+'''
+
+import os
+import struct
+from array import array
+
+import strfile
+
+MAGIC = b"QFCC"
+VERSION = 5
+
+HEADER = struct.Struct("=4sII")  # magic, version, number of files
+ENTRY = struct.Struct("=IqQQIIIcII")  # path length, mtime, size, inode,
+                                      # longlen, shortlen, flags, delim,
+                                      # number of offsets, number of pack
+                                      # chunk values; then the path, the
+                                      # offsets, the content ids, the text
+                                      # lengths, the length order and the
+                                      # chunk index
+
+
+def fileKey(path):
+    ''' Returns what must not change for a cached table to be valid '''
+    st = os.stat(path)
+    return((st.st_mtime_ns, st.st_size, st.st_ino))
+
+
+class CorpusCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # path: (key, table)
+        self.used = set()  # Paths asked for or stored in this session
+        self.dirty = False
+
+    def load(self):
+        ''' Reads the cache file. A missing or broken one is ignored. '''
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            self.entries = self.parse(data)
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            self.entries = {}
+
+    def parse(self, data):
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Unknown cache format")
+        entries = {}
+        pos = HEADER.size
+        for i in range(count):
+            (pathlen, mtime, size, inode, longlen, shortlen, flags,
+             delim, noffsets, nchunks) = ENTRY.unpack_from(data, pos)
+            pos += ENTRY.size
+            path = os.fsdecode(data[pos:pos + pathlen])
+            pos += pathlen
+            offsets = array("I")
+            offsets.frombytes(data[pos:pos + noffsets * offsets.itemsize])
+            pos += noffsets * offsets.itemsize
+            ids = array("Q")
+            ids.frombytes(data[pos:pos + (noffsets - 1) * ids.itemsize])
+            pos += (noffsets - 1) * ids.itemsize
+            lengths = array("I")
+            lengths.frombytes(data[pos:pos + (noffsets - 1)
+                                   * lengths.itemsize])
+            pos += (noffsets - 1) * lengths.itemsize
+            order = array("I")
+            order.frombytes(data[pos:pos + (noffsets - 1) * order.itemsize])
+            pos += (noffsets - 1) * order.itemsize
+            chunks = array("Q")
+            chunks.frombytes(data[pos:pos + nchunks * chunks.itemsize])
+            pos += nchunks * chunks.itemsize
+            if len(offsets) != noffsets or len(ids) != noffsets - 1 \
+                    or len(lengths) != noffsets - 1 \
+                    or len(order) != noffsets - 1 \
+                    or len(chunks) != nchunks:
+                raise ValueError("Truncated cache")
+            table = strfile.Strfile(offsets, longlen, shortlen, flags, delim,
+                                    ids, chunks or None, lengths, order)
+            entries[path] = ((mtime, size, inode), table)
+        return(entries)
+
+    def get(self, path):
+        ''' Returns the cached table of path if it is still valid '''
+        entry = self.entries.get(path)
+        if entry is None:
+            return(None)
+        try:
+            if fileKey(path) != entry[0]:
+                return(None)
+        except OSError:
+            return(None)
+        self.used.add(path)
+        return(entry[1])
+
+    def put(self, path, table, key=None):
+        ''' Stores the table of path. key is taken now if not given. '''
+        if key is None:
+            try:
+                key = fileKey(path)
+            except OSError:
+                return
+        self.entries[path] = (key, table)
+        self.used.add(path)
+        self.dirty = True
+
+    def save(self):
+        ''' Writes the tables, if some were stored in this session or the
+        file of another one changed or is gone. The tables of the files not
+        used in this session are kept, so a run over a few files does not
+        throw away the others. '''
+        stale = []
+        for path in set(self.entries) - self.used:
+            try:
+                if fileKey(path) == self.entries[path][0]:
+                    continue
+            except OSError:
+                pass
+            stale.append(path)
+        if not self.dirty and not stale:
+            return
+        for path in stale:
+            del self.entries[path]
+        chunks = [HEADER.pack(MAGIC, VERSION, len(self.entries))]
+        for path in sorted(self.entries):
+            key, table = self.entries[path]
+            name = os.fsencode(path)
+            offsets = array("I", table.offsets)
+            packchunks = array("Q", table.chunks or [])
+            chunks.append(ENTRY.pack(len(name), key[0], key[1], key[2],
+                                     table.longlen, table.shortlen,
+                                     table.flags, table.delim,
+                                     len(offsets), len(packchunks)))
+            chunks.append(name)
+            chunks.append(offsets.tobytes())
+            chunks.append(array("Q", table.ids).tobytes())
+            chunks.append(array("I", table.lengths).tobytes())
+            chunks.append(array("I", table.order).tobytes())
+            chunks.append(packchunks.tobytes())
+
+        tmp = self.path + "." + str(os.getpid()) + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(b"".join(chunks))
+            os.replace(tmp, self.path)
+        except OSError:
+            return  # Works anyway, just slower next time
+        self.dirty = False
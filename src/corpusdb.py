@@ -0,0 +1,461 @@
+''' The cookies in a SQLite database, for collections too big for memory.
+
+CorpusDB imports cookie files into a single database: a row per cookie
+with its text (rot13 ones already decrypted), file, length and content
+id, the language and offensive flag of its file, and an FTS5 index of the
+texts. Only new and changed files are imported again.
+
+DBStore answers what the window and the command line ask a
+cookiestore.CookieStore with indexed queries, so only the list of files
+is kept in memory. The cookies of a file have consecutive numbers and a
+rank that numbers them again by length, so the cookie at any place of a
+filtered view, or a random one up to or over some length, is a couple of
+index lookups. Unlike in CookieStore, the copies of a text in several
+files are separate cookies; sources() still lists all their files.
+'''
+
+import os
+import re
+import sys
+import time
+import bisect
+import sqlite3
+
+import strfile
+import packfile
+import cookiestore
+import corpuscache
+import profiling
+import search
+
+VERSION = 1  # Of the schema, kept in PRAGMA user_version
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, lang TEXT,
+    offensive INTEGER NOT NULL, saved INTEGER NOT NULL,
+    mtime INTEGER, size INTEGER, inode INTEGER,
+    start INTEGER NOT NULL, count INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS files_filter ON files (lang, offensive);
+CREATE TABLE IF NOT EXISTS cookies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, file INTEGER NOT NULL,
+    rank INTEGER NOT NULL, length INTEGER NOT NULL, hash INTEGER NOT NULL,
+    text TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS cookies_rank ON cookies (file, rank);
+CREATE INDEX IF NOT EXISTS cookies_length ON cookies (file, length, rank);
+CREATE INDEX IF NOT EXISTS cookies_hash ON cookies (hash);
+CREATE VIRTUAL TABLE IF NOT EXISTS cookies_fts USING fts5 (
+    text, content='cookies', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2');
+'''
+
+
+def signed(cid):
+    ''' Content ids are unsigned; SQLite integers are not '''
+    return(cid - (1 << 64) if cid >= 1 << 63 else cid)
+
+
+def unsigned(h):
+    return(h & 0xffffffffffffffff)
+
+
+def readCookies(path, offensive, cachedir):
+    ''' Returns the length and decoded text of every cookie of a file '''
+    table = packfile.load(path, os.path.join(cachedir, "dat"), offensive)
+    cookies = []
+    with packfile.openCookies(path) as f:
+        for offset, length, raw in strfile.records(f, table.delim):
+            text = raw.decode(errors="replace").replace("\r\n", "\n")
+            if table.isRotated():
+                text = cookiestore.decrypt(text)
+            cookies.append((length, text))
+    return(cookies)
+
+
+class CorpusDB:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != VERSION:
+            self.db.executescript("DROP TABLE IF EXISTS cookies_fts;"
+                                  "DROP TABLE IF EXISTS cookies;"
+                                  "DROP TABLE IF EXISTS files;")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.db.execute("PRAGMA user_version = %d" % VERSION)
+        self.db.commit()
+
+    def update(self, files, cachedir, stop=None, bases=None,
+               profile=None):
+        ''' Imports the files, a list of (path, lang, offensive, saved),
+        that are new or changed since they were imported, and removes the
+        files that are not in the list and are gone or under one of bases
+        (any file not in the list if bases is None). Every file is a
+        transaction. stop is asked between files whether to give up. The
+        files go to profile if it is given. Returns how many files were
+        imported and removed. '''
+        known = {}  # Path: file id, corpuscache.fileKey and cookies
+        for fileid, path, mtime, size, inode, count in self.db.execute(
+                "SELECT id, path, mtime, size, inode, count FROM files"):
+            known[path] = (fileid, (mtime, size, inode), count)
+        listed = set()
+        imported = removed = 0
+        for path, lang, offensive, saved in files:
+            if stop and stop():
+                return(imported, removed)
+            try:
+                key = corpuscache.fileKey(path)
+            except OSError:
+                continue
+            listed.add(path)
+            if path in known and known[path][1] == key:
+                if profile is not None:
+                    profile.addImport(path, known[path][2], key[1], 0, True)
+                continue
+            start = time.perf_counter()
+            try:
+                cookies = readCookies(path, offensive, cachedir)
+            except OSError:
+                continue
+            with self.db:
+                if path in known:
+                    self.deleteFile(known[path][0])
+                self.insertFile(path, lang, offensive, saved, key, cookies)
+            imported += 1
+            if profile is not None:
+                profile.addImport(path, len(cookies), key[1],
+                                  time.perf_counter() - start, False)
+        bases = None if bases is None else [os.path.join(b, "")
+                                             for b in bases]
+        for path, (fileid, key, count) in known.items():
+            if path not in listed and (
+                    bases is None or not os.path.isfile(path)
+                    or any(path.startswith(b) for b in bases)):
+                with self.db:
+                    self.deleteFile(fileid)
+                removed += 1
+        return(imported, removed)
+
+    def insertFile(self, path, lang, offensive, saved, key, cookies):
+        ''' Adds a file and its cookies, numbered after all the ones ever
+        added '''
+        row = self.db.execute("SELECT seq FROM sqlite_sequence"
+                              " WHERE name = 'cookies'").fetchone()
+        start = (row[0] if row else 0) + 1
+        rank = [0] * len(cookies)
+        for r, i in enumerate(sorted(range(len(cookies)),
+                                     key=lambda i: cookies[i][0])):
+            rank[i] = r
+        fileid = self.db.execute(
+            "INSERT INTO files (path, lang, offensive, saved, mtime, size,"
+            " inode, start, count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, lang, int(offensive), int(saved), key[0], key[1], key[2],
+             start, len(cookies))).lastrowid
+        self.db.executemany(
+            "INSERT INTO cookies (id, file, rank, length, hash, text)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            ((start + i, fileid, rank[i], length,
+              signed(cookiestore.contentId(text)), text)
+             for i, (length, text) in enumerate(cookies)))
+        self.db.execute("INSERT INTO cookies_fts (rowid, text)"
+                        " SELECT id, text FROM cookies WHERE file = ?",
+                        (fileid,))
+
+    def deleteFile(self, fileid):
+        self.db.execute("INSERT INTO cookies_fts (cookies_fts, rowid, text)"
+                        " SELECT 'delete', id, text FROM cookies"
+                        " WHERE file = ?", (fileid,))
+        self.db.execute("DELETE FROM cookies WHERE file = ?", (fileid,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (fileid,))
+
+    def close(self):
+        self.db.close()
+
+
+def loadCorpus(bases, cachedir, dbpath, extra=[], profile=None):
+    ''' Imports the new and changed cookie files under bases plus the
+    extra ones, a list of (path, lang, offensive, saved), into the
+    database dbpath and returns a DBStore of it. '''
+    if profile is None:
+        profile = profiling.Profile()
+    with profile.phase("discovery"):
+        files = [f + (False,) for f in cookiestore.findFiles(bases)] + extra
+    corpus = CorpusDB(dbpath)
+    with profile.phase("import"):
+        corpus.update(files, cachedir, bases=bases, profile=profile)
+    return(DBStore(corpus))
+
+
+class Column:
+    ''' A column of the cookies as a sequence indexed by cookie number '''
+    def __init__(self, db, column, convert=None):
+        self.db = db
+        self.query = "SELECT " + column + " FROM cookies WHERE id = ?"
+        self.convert = convert
+
+    def __getitem__(self, n):
+        row = self.db.execute(self.query, (n,)).fetchone()
+        if row is None:
+            return(None)
+        return(self.convert(row[0]) if self.convert else row[0])
+
+
+class Copies:
+    ''' Content id: all its cookies, if more than one, as in CookieStore '''
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, cid, default=None):
+        copies = [n for n, in self.db.execute(
+            "SELECT id FROM cookies WHERE hash = ? ORDER BY id",
+            (signed(cid),))]
+        return(copies if len(copies) > 1 else default)
+
+    def items(self):
+        for h, ids in self.db.execute(
+                "SELECT hash, group_concat(id) FROM cookies GROUP BY hash"
+                " HAVING COUNT(*) > 1"):
+            yield(unsigned(h), sorted(int(n) for n in ids.split(",")))
+
+
+class RankOrder:
+    ''' The local numbers of the cookies of a file sorted by length, as
+    the arrays of CookieStore.lengthRange '''
+    def __init__(self, store, fileid):
+        self.db = store.db
+        self.dbid = store.dbids[fileid]
+        self.start = store.filestart[fileid]
+        self.count = store.filecount[fileid]
+
+    def __len__(self):
+        return(self.count)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.count)
+            return([n - self.start for n, in self.db.execute(
+                "SELECT id FROM cookies WHERE file = ? AND rank >= ?"
+                " AND rank < ? ORDER BY rank", (self.dbid, start, stop))]
+                   [::step])
+        row = self.db.execute("SELECT id FROM cookies WHERE file = ?"
+                              " AND rank = ?", (self.dbid, i)).fetchone()
+        return(row[0] - self.start if row else i)  # i if the file is gone
+
+
+class DBView:
+    ''' The cookies of some files that fit length limits, as a sequence
+    of cookie numbers: the fitting ones of every file by length, or in
+    file order when all of them fit. '''
+    def __init__(self, store, files, shortmax=None, longmin=None):
+        self.store = store
+        self.files = []
+        self.ranges = []  # RankOrder, start and end of every file
+        self.places = [0]  # Place of the first cookie of every file
+        for fileid in sorted(files):
+            order, start, end = store.lengthRange(fileid, shortmax, longmin)
+            if end > start:
+                self.files.append(fileid)
+                self.ranges.append((order, start, end))
+                self.places.append(self.places[-1] + end - start)
+
+    def __len__(self):
+        return(self.places[-1])
+
+    def __getitem__(self, p):
+        if p < 0:
+            p += len(self)
+        if not 0 <= p < len(self):
+            raise IndexError("View index out of range")
+        i = bisect.bisect_right(self.places, p) - 1
+        order, start, end = self.ranges[i]
+        first = self.store.filestart[self.files[i]]
+        if end - start == len(order):
+            return(first + p - self.places[i])
+        return(first + order[start + p - self.places[i]])
+
+    def index(self, n):
+        ''' Returns the place of cookie n '''
+        fileid = self.store.fileNumber(n)
+        i = bisect.bisect_left(self.files, fileid) if fileid is not None \
+            else len(self.files)
+        if i == len(self.files) or self.files[i] != fileid:
+            raise ValueError("Cookie not in the view")
+        order, start, end = self.ranges[i]
+        if end - start == len(order):
+            return(self.places[i] + n - self.store.filestart[fileid])
+        rank = self.store.rank[n]
+        if rank is None or not start <= rank < end:
+            raise ValueError("Cookie not in the view")
+        return(self.places[i] + rank - start)
+
+    def __contains__(self, n):
+        try:
+            self.index(n)
+        except ValueError:
+            return(False)
+        return(True)
+
+
+class DBStore:
+    ''' The cookies of a CorpusDB, asked as those of a CookieStore. Only
+    the files are kept in memory; refresh() reads them again after the
+    database changed. '''
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.db = corpus.db
+        self.cid = Column(self.db, "hash", unsigned)
+        self.textlen = Column(self.db, "length")
+        self.length = self.textlen  # There is nothing between cookies
+        self.rank = Column(self.db, "rank")
+        self.copies = Copies(self.db)
+        self.refresh()
+
+    def refresh(self):
+        rows = self.db.execute(
+            "SELECT id, path, lang, offensive, saved, start, count"
+            " FROM files ORDER BY start, count").fetchall()
+        self.dbids = [r[0] for r in rows]
+        self.numbers = dict((r[0], i) for i, r in enumerate(rows))
+        self.files = [(r[1], r[2], bool(r[3]), bool(r[4]), b"%")
+                      for r in rows]
+        self.filestart = [r[5] for r in rows]
+        self.filecount = [r[6] for r in rows]
+        self.fileid = Column(self.db, "file", self.numbers.get)
+        self.unique = DBView(self, range(len(rows)))
+
+    def fileNumber(self, n):
+        ''' Returns the number of the file of cookie n, or None '''
+        i = bisect.bisect_right(self.filestart, n) - 1
+        if i < 0 or n >= self.filestart[i] + self.filecount[i]:
+            return(None)
+        return(i)
+
+    def fileId(self, path):
+        for i, f in enumerate(self.files):
+            if f[0] == path:
+                return(i)
+        return(None)
+
+    def text(self, n):
+        row = self.db.execute("SELECT text FROM cookies WHERE id = ?",
+                              (n,)).fetchone()
+        return(row[0] if row else "")
+
+    def path(self, n):
+        i = self.fileNumber(n)
+        return(None if i is None else self.files[i][0])
+
+    def sources(self, n):
+        ''' Returns the paths of all the files with the text of cookie n '''
+        return([p for p, in self.db.execute(
+            "SELECT files.path FROM cookies AS c"
+            " JOIN cookies AS s ON s.hash = c.hash"
+            " JOIN files ON files.id = s.file WHERE c.id = ? ORDER BY s.id",
+            (n,))])
+
+    def originals(self, numbers):
+        ''' Copies are cookies of their own here '''
+        return(sorted(set(numbers)))
+
+    def lengthRange(self, fileid, shortmax=None, longmin=None):
+        ''' As CookieStore.lengthRange, with index lookups '''
+        count = self.filecount[fileid]
+        start = 0 if longmin is None else self.longerThan(fileid, longmin)
+        end = count if shortmax is None else self.longerThan(fileid,
+                                                             shortmax)
+        return(RankOrder(self, fileid), start, max(start, end))
+
+    def longerThan(self, fileid, length):
+        ''' Returns the rank of the first cookie of a file longer than
+        length, which is how many are not '''
+        row = self.db.execute(
+            "SELECT rank FROM cookies WHERE file = ? AND length > ?"
+            " ORDER BY length, rank LIMIT 1",
+            (self.dbids[fileid], length)).fetchone()
+        return(row[0] if row else self.filecount[fileid])
+
+    def countLength(self, fileid, shortmax=None, longmin=None):
+        order, start, end = self.lengthRange(fileid, shortmax, longmin)
+        return(end - start)
+
+    def view(self, files, shortmax=None, longmin=None):
+        return(DBView(self, files, shortmax, longmin))
+
+    def langs(self):
+        return(sorted(set(f[1] for f in self.files if f[1])))
+
+    def lang(self, n):
+        i = self.fileNumber(n)
+        return(None if i is None else self.files[i][1])
+
+    def isOffensive(self, n):
+        i = self.fileNumber(n)
+        return(i is not None and self.files[i][2])
+
+    def countUnique(self):
+        return(self.db.execute("SELECT COUNT(DISTINCT hash)"
+                               " FROM cookies").fetchone()[0])
+
+    def selectFiles(self, offensive=None, lang=None, path=None):
+        return([i for i, f in enumerate(self.files)
+                if (offensive is None or f[2] == offensive)
+                and (lang is None or f[1] == lang)
+                and (path is None or f[0] == path)])
+
+    def footprint(self):
+        ''' Returns about how many bytes the files take, and the size of
+        the database, which is not in memory '''
+        size = sys.getsizeof
+        parts = {"files": size(self.files) + sum(size(f) + size(f[0])
+                                                 for f in self.files)
+                 + size(self.filestart) + size(self.filecount)
+                 + size(self.dbids) + size(self.numbers)}
+        parts["total"] = parts["files"]
+        try:
+            parts["database (on disk)"] = os.path.getsize(self.corpus.path)
+        except OSError:
+            pass
+        return(parts)
+
+    def close(self):
+        self.corpus.close()
+
+
+class TextSearch:
+    ''' Search with the FTS5 index, as search.SearchIndex does. A query
+    word matches the words that start with it. '''
+    def __init__(self, store, files=None):
+        self.store = store
+        self.files = None if files is None else set(files)
+
+    def inFiles(self, numbers):
+        if self.files is None:
+            return(numbers)
+        return([n for n in numbers
+                if self.store.fileNumber(n) in self.files])
+
+    def find(self, query):
+        ''' Returns the sorted numbers of the cookies with all the words of
+        query '''
+        words = sorted(set(search.WORDS.findall(search.fold(query))))
+        if not words:
+            return([])
+        match = " ".join('"' + w + '"*' for w in words)
+        return(self.inFiles([n for n, in self.store.db.execute(
+            "SELECT rowid FROM cookies_fts WHERE cookies_fts MATCH ?"
+            " ORDER BY rowid", (match,))]))
+
+    def match(self, pattern, flags=0):
+        ''' Returns the sorted numbers of the cookies matching the regular
+        expression pattern. The words it needs may be inside others,
+        which the index can not tell, so all the texts are checked. '''
+        regex = re.compile(pattern, flags)
+        files = range(len(self.store.files)) if self.files is None \
+            else sorted(self.files)
+        found = []
+        for fileid in files:
+            found.extend(n for n, text in self.store.db.execute(
+                "SELECT id, text FROM cookies WHERE file = ? ORDER BY id",
+                (self.store.dbids[fileid],)) if regex.search(text))
+        return(found)
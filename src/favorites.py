@@ -0,0 +1,90 @@
+''' Favorite cookies, kept in a SQLite database.
+
+Cookies are keyed by a hash of their text, so knowing whether a cookie is
+saved is a set lookup. SQLite in WAL mode makes every change atomic and
+lets several running instances share the database. The classic
+%-delimited favorites file is written as an export after every change,
+so it can still be read as a cookie file.
+'''
+
+import os
+import time
+import sqlite3
+import hashlib
+
+import strfile
+import packfile
+
+
+def cookieKey(text):
+    return(hashlib.blake2b(text.strip().encode(), digest_size=16).hexdigest())
+
+
+class Favorites:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS favorites ("
+                        "key TEXT PRIMARY KEY, text TEXT NOT NULL, "
+                        "source TEXT, added REAL)")
+        self.db.commit()
+        self.version = None
+        self.keys = set()
+        self.refresh()
+
+    def refresh(self):
+        ''' Reloads the saved keys if another instance changed them '''
+        version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.version:
+            self.keys = set(k for k, in
+                            self.db.execute("SELECT key FROM favorites"))
+            self.version = version
+
+    def __len__(self):
+        return(len(self.keys))
+
+    def __contains__(self, text):
+        return(cookieKey(text) in self.keys)
+
+    def add(self, text, source=None):
+        self.addMany([text], source)
+
+    def addMany(self, texts, source=None):
+        ''' Adds several cookies in a single transaction '''
+        rows = [(cookieKey(t), t.strip("\n"), source, time.time())
+                for t in texts]
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO favorites "
+                                "VALUES (?, ?, ?, ?)", rows)
+        self.keys.update(row[0] for row in rows)
+
+    def remove(self, text):
+        key = cookieKey(text)
+        with self.db:
+            self.db.execute("DELETE FROM favorites WHERE key = ?", (key,))
+        self.keys.discard(key)
+
+    def texts(self):
+        return([t for t, in self.db.execute(
+            "SELECT text FROM favorites ORDER BY added")])
+
+    def importFile(self, path):
+        ''' Adds the cookies of a %-delimited file. Returns how many. '''
+        with packfile.openCookies(path) as f:
+            texts = [raw.decode(errors="replace").replace("\r\n", "\n")
+                     for offset, length, raw in strfile.records(f)]
+        self.addMany(texts, path)
+        return(len(texts))
+
+    def export(self, path):
+        ''' Writes all the favorites to a %-delimited file, atomically '''
+        tmp = path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "w") as f:
+            for text in self.texts():
+                f.write(text + "\n%\n")
+        os.replace(tmp, path)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,94 @@
+''' Builds everything derived from the cookie files, on all the cores.
+
+Every file is read once by a worker process, which computes its offset
+table, the content ids of its cookies (decrypting rot13 ones) and its
+search index, and writes its .dat and .idx files. The tables are then
+merged, in the order of the paths, into the corpus cache. Every file is
+written to a temporary name and renamed, so readers never see half of
+one.
+'''
+
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import strfile
+import packfile
+import cookiestore
+import corpuscache
+import search
+
+
+def indexFile(path, offensive, cachedir):
+    ''' Reads a cookie file once and writes its offset table and search
+    index. Returns path, key and offset table, with the content ids, text
+    lengths and length order, or None if the file can not be read. '''
+    ids = array("Q")
+    lengths = array("I")
+    postings = {}
+    rotated = offensive  # Unless a .dat file says otherwise
+
+    def visit(i, length, raw):
+        text = raw.decode(errors="replace")
+        if rotated:
+            text = cookiestore.decrypt(text)
+        ids.append(cookiestore.contentId(text))
+        lengths.append(length)
+        for word in search.words(text):
+            postings.setdefault(word, array("I")).append(i)
+
+    try:
+        key = corpuscache.fileKey(path)
+        table = packfile.load(path, os.path.join(cachedir, "dat"), offensive,
+                              visit)
+        if not ids and table.numstr:  # From a .dat file, not read yet
+            rotated = table.isRotated()
+            with packfile.openCookies(path) as f:
+                records = strfile.records(f, table.delim)
+                for i, (offset, length, raw) in enumerate(records):
+                    visit(i, length, raw)
+        if len(ids) != table.numstr:
+            return(None)  # Changed while being read
+        table.ids = ids
+        table.lengths = lengths
+        table.order = cookiestore.lengthOrder(lengths)
+        idxfile = search.indexPath(path, cachedir)
+        os.makedirs(os.path.dirname(idxfile), exist_ok=True)
+        search.FileIndex(postings, key).write(idxfile)
+    except OSError:
+        return(None)
+    return(path, key, table)
+
+
+def buildIndex(bases, cachedir, extra=[], jobs=None):
+    ''' Indexes all the cookie files under bases plus the extra ones, a
+    list of (path, lang, offensive, saved), with jobs processes (one per
+    core by default). Returns the number of files and cookies indexed
+    and the seconds it took. '''
+    start = time.perf_counter()
+    files = sorted(set((path, offensive) for path, lang, offensive
+                       in cookiestore.findFiles(bases))
+                   | set((f[0], f[2]) for f in extra
+                         if os.path.isfile(f[0])))
+    args = ([f[0] for f in files], [f[1] for f in files],
+            [cachedir] * len(files))
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        results = list(map(indexFile, *args))
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            # Several files per task, but enough tasks to even the load
+            results = list(executor.map(
+                indexFile, *args, chunksize=max(1, len(files) // (8 * jobs))))
+
+    cache = corpuscache.CorpusCache(os.path.join(cachedir, "corpus.cache"))
+    cache.load()  # Other files, as opened ones, are kept
+    cookies = 0
+    for result in results:
+        if result is not None:
+            path, key, table = result
+            cache.put(path, table, key)
+            cookies += table.numstr
+    cache.save()
+    return(len(cache.used), cookies, time.perf_counter() - start)
@@ -0,0 +1,240 @@
+''' Compressed cookie files (packs) that can be read at random.
+
+A pack is a cookie file compressed with gzip (.gz), xz (.xz) or, when the
+zstandard module is installed, zstd (.zst). Any such file works, but
+packs made by pack() are a series of independent members of about 64 KiB
+of whole cookies. Standard tools (zcat, xzcat, zstdcat) still read them
+as a single file.
+
+Reading a pack once gives its offset table and an index of where every
+member starts, both in the compressed file and in the text. Showing a
+cookie then decompresses only its member.
+'''
+
+import os
+import gzip
+import lzma
+import zlib
+import bisect
+from array import array
+from collections import OrderedDict
+
+import strfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK = 1 << 16  # Bytes of text per member of the packs made here
+
+ERRORS = (ValueError, EOFError, lzma.LZMAError, zlib.error) \
+    + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def formats():
+    ''' Returns the extensions of the packs that can be read here '''
+    return([".gz", ".xz"] + ([".zst"] if zstandard else []))
+
+
+def isPack(path):
+    return(os.path.splitext(path)[1] in formats())
+
+
+def decompressor(path):
+    ''' Returns a decompressor for one member of the pack path '''
+    ext = os.path.splitext(path)[1]
+    if ext == ".gz":
+        return(zlib.decompressobj(zlib.MAX_WBITS | 16))
+    if ext == ".xz":
+        return(lzma.LZMADecompressor(lzma.FORMAT_XZ))
+    if ext == ".zst" and zstandard:
+        return(zstandard.ZstdDecompressor().decompressobj())
+    raise ValueError(path + ": unknown compression")
+
+
+def compress(data, ext):
+    ''' Returns data as a single member of the format of ext '''
+    if ext == ".gz":
+        return(gzip.compress(data, 9))
+    if ext == ".xz":
+        return(lzma.compress(data, lzma.FORMAT_XZ, preset=9))
+    if ext == ".zst" and zstandard:
+        return(zstandard.ZstdCompressor(level=19).compress(data))
+    raise ValueError(ext + ": unknown compression")
+
+
+def members(f, path):
+    ''' Yields the offset and the decompressed bytes of every member of
+    the open pack f. A broken pack raises OSError. '''
+    try:
+        yield from readMembers(f, path)
+    except ERRORS as e:
+        raise OSError(path + ": " + str(e))
+
+
+def readMembers(f, path):
+    pos = 0
+    data = f.read(CHUNK)
+    while data:
+        d = decompressor(path)
+        start = pos
+        out = []
+        while True:
+            out.append(d.decompress(data))
+            if d.eof:
+                pos += len(data) - len(d.unused_data)
+                data = d.unused_data
+                break
+            pos += len(data)
+            data = f.read(CHUNK)
+            if not data:
+                raise OSError(path + ": truncated")
+        yield(start, b"".join(out))
+        if not data:
+            data = f.read(CHUNK)
+
+
+class Stream:
+    ''' The text of a pack as a file for strfile.records. It notes where
+    every member starts in chunks: text offset and compressed offset
+    pairs, ending with the sizes of both. '''
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+        self.members = members(self.f, path)
+        self.chunks = array("Q")
+        self.pos = 0
+        self.buffer = b""
+
+    def read(self, n=-1):
+        while self.members and (n < 0 or len(self.buffer) < n):
+            try:
+                cpos, data = next(self.members)
+            except StopIteration:
+                self.chunks.extend((self.pos + len(self.buffer),
+                                    os.fstat(self.f.fileno()).st_size))
+                self.members = None
+                break
+            self.chunks.extend((self.pos + len(self.buffer), cpos))
+            self.buffer += data
+        if n < 0:
+            n = len(self.buffer)
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        self.pos += len(data)
+        return(data)
+
+    def tell(self):
+        return(self.pos)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def openCookies(path):
+    ''' Opens a cookie file, a pack or not, to read its text '''
+    if isPack(path):
+        return(Stream(path))
+    return(open(path, "rb"))
+
+
+def build(path, rotated=False, delim=b"%", visit=None):
+    ''' Reads a whole pack and returns its offset table with the index of
+    its members in chunks. visit is as in strfile.scan(). '''
+    with Stream(path) as f:
+        table = strfile.scan(f, rotated, delim, visit)
+        f.read()  # Up to the end, for the last chunk
+        table.chunks = f.chunks
+    return(table)
+
+
+def load(path, cachedir, rotated=False, visit=None):
+    ''' Returns the offset table of a cookie file, a pack or not. visit is
+    as in strfile.load(). '''
+    if isPack(path):
+        return(build(path, rotated, visit=visit))
+    return(strfile.load(path, cachedir, rotated, visit))
+
+
+class Pack:
+    ''' Random access to the text of a pack. It is sliced as the memory
+    map of a plain file. The last members read are kept. '''
+    def __init__(self, path, chunks, keep=4):
+        self.path = path
+        self.f = open(path, "rb")
+        self.textstart = chunks[0::2]
+        self.packstart = chunks[1::2]
+        self.keep = keep
+        self.recent = OrderedDict()  # Member number: its text
+
+    def member(self, i):
+        data = self.recent.get(i)
+        if data is not None:
+            self.recent.move_to_end(i)
+            return(data)
+        self.f.seek(self.packstart[i])
+        packed = self.f.read(self.packstart[i + 1] - self.packstart[i])
+        try:
+            data = decompressor(self.path).decompress(packed)
+        except ERRORS as e:
+            raise OSError(self.path + ": " + str(e))
+        self.recent[i] = data
+        if len(self.recent) > self.keep:
+            self.recent.popitem(last=False)
+        return(data)
+
+    def __getitem__(self, part):
+        start, stop = part.start, part.stop
+        i = bisect.bisect_right(self.textstart, start) - 1
+        out = []
+        while start < stop and 0 <= i < len(self.textstart) - 1:
+            base = self.textstart[i]
+            out.append(self.member(i)[start - base:stop - base])
+            start = self.textstart[i + 1]
+            i += 1
+        return(b"".join(out))
+
+    def close(self):
+        self.f.close()
+
+
+def pack(src, dest, ext=".xz", chunksize=CHUNK, delim=b"%"):
+    ''' Writes the cookie file src as the pack dest, in members of about
+    chunksize bytes that start at a cookie '''
+    with open(src, "rb") as f:
+        data = f.read()
+        f.seek(0)
+        starts = [offset for offset, length, text
+                  in strfile.records(f, delim, False)]
+    cuts = [0]
+    for offset in starts:
+        if offset - cuts[-1] >= chunksize:
+            cuts.append(offset)
+    cuts.append(len(data))
+    tmp = dest + "." + str(os.getpid()) + ".tmp"
+    with open(tmp, "wb") as f:
+        for start, end in zip(cuts, cuts[1:]):
+            if end > start:
+                f.write(compress(data[start:end], ext))
+    os.replace(tmp, dest)
+
+
+def packTree(src, dest, ext=".xz"):
+    ''' Packs every cookie file of the src tree (lang and lang/off
+    directories) into the same place of the dest tree. Yields the source
+    and the pack of every file. '''
+    import cookiestore
+
+    for path, lang, offensive in cookiestore.findFiles([src]):
+        if isPack(path):
+            continue
+        target = os.path.join(dest, os.path.relpath(path, src)) + ext
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        pack(path, target, ext)
+        yield(path, target)
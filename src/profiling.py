@@ -0,0 +1,108 @@
+''' Where the time goes: phases of loading, every file read and the
+latency of showing cookies. '''
+
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def percentiles(samples):
+    ''' Returns count, p50, p95, p99 and max of samples '''
+    samples = sorted(samples)
+    if not samples:
+        return({"count": 0})
+    return({"count": len(samples),
+            "p50": samples[len(samples) // 2],
+            "p95": samples[int(len(samples) * 0.95)],
+            "p99": samples[int(len(samples) * 0.99)],
+            "max": samples[-1]})
+
+
+class Profile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}  # Name: milliseconds spent
+        self.marks = {}  # Name: milliseconds since start, the first time
+        self.files = {}  # Path: times and sizes of reading it
+        self.latencies = deque(maxlen=1000)  # Milliseconds of the last ones
+
+    @contextmanager
+    def phase(self, name):
+        ''' Adds the time of the block to the phase name '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (self.phases.get(name, 0)
+                                 + (time.perf_counter() - start) * 1000)
+
+    def mark(self, name):
+        self.marks.setdefault(name, (time.perf_counter() - self.start) * 1000)
+
+    def addFile(self, path, table, parse, ids, decrypt, cached):
+        ''' Records the seconds spent reading the offsets and computing the
+        content ids (decrypting included) of a file '''
+        self.files[path] = {"cookies": table.numstr,
+                            "bytes": table.offsets[-1] if table.offsets
+                            else 0,
+                            "parse_ms": parse * 1000, "ids_ms": ids * 1000,
+                            "decrypt_ms": decrypt * 1000, "cached": cached}
+
+    def addImport(self, path, cookies, size, seconds, cached):
+        ''' Records a file imported into a database in seconds, or already
+        there if cached '''
+        self.files[path] = {"cookies": cookies, "bytes": size,
+                            "parse_ms": seconds * 1000, "ids_ms": 0,
+                            "decrypt_ms": 0, "cached": cached}
+
+    def addLatency(self, seconds):
+        self.latencies.append(seconds * 1000)
+
+    def report(self, store=None):
+        ''' Returns everything as a dict that can be saved as JSON '''
+        files = [dict(path=path, **stats)
+                 for path, stats in sorted(self.files.items())]
+        report = {"phases_ms": dict(self.phases),
+                  "marks_ms": dict(self.marks),
+                  "files": files,
+                  "totals": {"files": len(files),
+                             "cookies": sum(f["cookies"] for f in files),
+                             "bytes": sum(f["bytes"] for f in files),
+                             "cached": sum(f["cached"] for f in files)},
+                  "latency_ms": percentiles(self.latencies)}
+        if store is not None:
+            report["memory"] = store.footprint()  # Before counting builds
+            report["totals"]["unique"] = store.countUnique()  # more
+        return(report)
+
+
+def formatReport(report):
+    ''' Returns a report as text for people '''
+    lines = ["%10s %10s %9s %9s %9s  %s" % ("cookies", "bytes", "parse ms",
+                                            "ids ms", "rot13 ms", "file")]
+    for f in report["files"]:
+        lines.append("%10d %10d %9.2f %9.2f %9.2f  %s%s" % (
+            f["cookies"], f["bytes"], f["parse_ms"], f["ids_ms"],
+            f["decrypt_ms"], f["path"], " (cached)" if f["cached"] else ""))
+    totals = report["totals"]
+    lines.append("")
+    lines.append("%d files, %d cookies (%s different), %d bytes, %d from"
+                 " the cache" % (totals["files"], totals["cookies"],
+                                 totals.get("unique", "?"), totals["bytes"],
+                                 totals["cached"]))
+    lines.append("")
+    for name, ms in list(report["phases_ms"].items()) \
+            + list(report["marks_ms"].items()):
+        lines.append("%-24s %10.2f ms" % (name, ms))
+    if "memory" in report:
+        lines.append("")
+        for name, size in report["memory"].items():
+            lines.append("%-24s %10d KiB" % ("memory " + name, size // 1024))
+    latency = report["latency_ms"]
+    if latency["count"]:
+        lines.append("")
+        lines.append("latency of %d cookies: p50 %.3f ms, p95 %.3f ms,"
+                     " p99 %.3f ms, max %.3f ms" % (
+                         latency["count"], latency["p50"], latency["p95"],
+                         latency["p99"], latency["max"]))
+    return("\n".join(lines))
@@ -1,555 +1,383 @@
 #!/usr/bin/python3
 
 import os
-import random
-import gettext
-
-from PyQt5.QtCore import (QSettings, QSize,
-                          Qt, QT_VERSION_STR)
-from PyQt5.QtGui import QIcon, QKeySequence, QFont
-from PyQt5.QtWidgets import (QWidget, QAction, QApplication, QComboBox,
-                             QMainWindow, QLabel, QFileDialog,
-                             QTabWidget, QGridLayout, QVBoxLayout,
-                             QHBoxLayout, QMessageBox, QTextEdit, QPushButton)
-
-PROGRAM_NAME = "QFortune"
-EXECUTABLE_NAME = "qfortune"
-
-gettext.translation("qfortune", localedir="/usr/share/locale",
-                    fallback=True).install()
-
-DESCRIPTION = _("A pyQt5 interface for reading fortune cookies")
-VERSION = "0.5a"
-AUTHOR = "Manuel Domínguez López"  # See AUTHORS file
-MAIL = "mdomlop@gmail.com"
-SOURCE = "https://github.com/mdomlop/qfortune"
-LICENSE = "GPLv3+"  # Read LICENSE file.
-
-COPYRIGHT = '''
-Copyright: 2017 Manuel Domínguez López <mdomlop@gmail.com>
-License: GPL-3.0+
-
- This program is free software: you can redistribute it and/or modify
- it under the terms of the GNU General Public License as published by
- the Free Software Foundation, either version 3 of the License, or
- (at your option) any later version.
- .
- This package is distributed in the hope that it will be useful,
- but WITHOUT ANY WARRANTY; without even the implied warranty of
- MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
- GNU General Public License for more details.
- .
- You should have received a copy of the GNU General Public License
- along with this program. If not, see <https://www.gnu.org/licenses/>.
- .
- On Debian systems, the complete text of the GNU General
- Public License version 3 can be found in "/usr/share/common-licenses/GPL-3".
-'''
-
-
-class MainWindow(QMainWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__()
-
-        self.epigrams = {}  # Database containing all fortune cookies
-        self.elist = []  # Only a list for random access to epigrams dict.
-        self.statics = {}
-        self.cookie_files = []  # All cookie files
-
-        self.savename = "favorites.cookies"
-        self.savebase = os.path.join(os.getenv("HOME"), ".config",
-                                     EXECUTABLE_NAME)
-        self.savefile = os.path.join(self.savebase, self.savename)
-
-        self.loadDir()
-        self.loadFile(self.savefile, None, False, True)  # lang, offensive, saved
-        self.elist = list(self.epigrams.keys())
-        self.nepigrams = len(self.elist)
-        random.shuffle(self.elist)
-
-        self.statusOrigin = QLabel()
-        self.statusOffensive = QLabel()
-        self.statusSaved = QLabel()
-        self.statusCopied = QLabel()
-
-        self.comboGoTo = QComboBox()
-        for i in range(self.nepigrams):
-            self.comboGoTo.addItem(str(i + 1))
-        self.comboGoTo.setEditable(True)
-        self.comboGoTo.currentIndexChanged[str].connect(self.goToComboIndex)
-        # self.comboGoTo.setValidator('#')
-
-        self.index = -1
-
-        self.textEdit = QTextEdit()
-        self.textEdit.setReadOnly(True)
-        self.setCentralWidget(self.textEdit)
-
-        self.createActions()
-        self.createMenus()
-        self.createToolBars()
-        self.createStatusBar()
-
-        self.nextCookie()  # Starts showing a cookie
-
-        self.readSettings()
-
-    def decrypt(self, s):  # Unix offensive fortunes are rot13 encoded
-        rot13 = str.maketrans(
-            "ABCDEFGHIJKLMabcdefghijklmNOPQRSTUVWXYZnopqrstuvwxyz",
-            "NOPQRSTUVWXYZnopqrstuvwxyzABCDEFGHIJKLMabcdefghijklm")
-        return(str.translate(s, rot13))
-
-    def loadDir(self):
-        ''' Only returns a list of found cookie files. '''
-        app_fortunes = "/usr/share/" + EXECUTABLE_NAME + "/fortunes"
-        custom_fortunes = os.path.join(os.getenv("HOME"),
-                                       ".config/" + EXECUTABLE_NAME
-                                       + "/fortunes")
-        fortunes = [app_fortunes, custom_fortunes]
-
-        for base in fortunes:
-            if os.path.isdir(base):
-                try:
-                    langs = os.listdir(base)
-                except:
-                    next  # Skip empty directory
-                for lang in langs:
-                    path = os.path.join(base, lang)
-                    cdir = (path, lang, False)
-                    path = os.path.join(path, 'off')  # Check if offensive
-                    ocdir = (path, lang, True)
-
-                    for i in cdir, ocdir:
-                        try:
-                            l = os.listdir(i[0])
-                        except:
-                            l = []
-                        for f in l:
-                            f = os.path.join(i[0], f)
-                            self.loadFile(f, i[1], i[2])
-
-    def loadFile(self, path, lang=None, offensive=False, saved=False):
-        ''' Adds a cookie file to the epigrams DB '''
-        if not os.path.isfile(path):
-            return(1)
-
-        n = 0  # Count entries
-        try:  # Populate epigrams with a fortune database file
-            with open(path, "r") as f:
-                text = f.read()
-        except:
-            text = None
-        f.close()
-        if text:
-            for line in text.split("\n%\n"):
-                if line:
-                    n += 1
-                    if offensive:
-                        line = self.decrypt(line)
-                    self.epigrams.update({line: [line, path, lang,
-                                                 offensive, saved]})
-            self.statics.update({path: (n, offensive)})
-
-    def goToComboIndex(self):
-        i = self.comboGoTo.currentIndex()
-        if i >= 0 and i < self.nepigrams:
-            self.index = i
-        self.showCookie()
-
-    def firstCookie(self):
-        self.index = 0
-        self.showCookie()
-
-    def lastCookie(self):
-        self.index = self.nepigrams - 1
-        self.showCookie()
-
-    def nextCookie(self):
-        self.index += 1
-        if self.index >= self.nepigrams:
-            self.index = 0  # Go to the beginning
-        self.showCookie()
-
-    def prevCookie(self):
-        self.index -= 1
-        if self.index < 0:
-            self.index = self.nepigrams - 1  # Go to the end
-        self.showCookie()
-
-    def saveCookie(self):
-        formatcookie = self.cookie + "\n%\n"
-        if not self.epigrams[self.elist[self.index]][4]:  # 4 is true if save
-            try:
-                os.makedirs(self.savebase, exist_ok=True)
-            except:
-                QMessageBox.warning(self, _("Warning"),
-                                    _("I can not create the directory:")
-                                    + " <p><pre>" + self.savebase
-                                    + "</pre>")
-                return(1)
-            try:
-                with open(self.savefile, 'a') as f:
-                    f.write(formatcookie)
-            except PermissionError:
-                QMessageBox.warning(self, _("Warning"),
-                                    _("No permission to write the file:")
-                                    + " <p><pre>" + self.savefile
-                                    + "</pre>")
-                f.close()
-                return(1)
-            except:
-                QMessageBox.warning(self, _("Warning"),
-                                    _("I can not write the file:")
-                                    + " <p><pre>" + self.savefile
-                                    + "</pre>")
-                f.close()
-                return(1)
-            f.close()
-            self.epigrams[self.elist[self.index]][4] = True
-        self.updateInterface()
-
-    def copyCookie(self):
-        self.textEdit.selectAll()
-        self.textEdit.copy()
-        self.textEdit.clearFocus()
-        self.updateInterface()
-
-    def about(self):
-        aboutdialog.show()
-
-    def isSaved(self):
-        ''' Returns status, text and abbreviation '''
-        if self.epigrams[self.elist[self.index]][4]:  # 4 is true if save
-            return((False, _("Saved")))
-        return((True, _("Unsaved")))
-
-    def isOffensive(self):
-        ''' Returns status, text and abbreviation '''
-        if self.epigrams[self.elist[self.index]][3]:  # 3 is true if offensive
-            return((True, _("Offensive")))
-        return((False, ""))
-
-    def isCopied(self):
-        if QApplication.clipboard().text() == self.cookie:
-            return((True, _("Copied")))
-        return((False, ""))
-
-    def isFirst(self):
-        if self.index == 0:
-            return(True)
-        return(False)
-
-    def isLast(self):
-        if self.index == self.nepigrams - 1:
-            return(True)
-        return(False)
-
-    def updateStatus(self):
-        path = self.epigrams[self.elist[self.index]][1]  # 1 is path
-        origin = _("From:") + " " + os.path.basename(path)
-        offensive = self.isOffensive()[1]
-        saved = self.isSaved()[1]
-        copied = self.isCopied()[1]
-        self.statusOrigin.setText(origin)
-        self.statusOffensive.setText(offensive)
-        self.statusSaved.setText(saved)
-        self.statusCopied.setText(copied)
-
-    def updateInterface(self):
-        self.comboGoTo.setCurrentIndex(self.index)
-        self.firstAct.setEnabled(not self.isFirst())
-        self.prevAct.setEnabled(not self.isFirst())
-
-        self.lastAct.setEnabled(not self.isLast())
-        self.nextAct.setEnabled(not self.isLast())
-
-        self.copyAct.setEnabled(not self.isCopied()[0])
-        self.saveAct.setEnabled(self.isSaved()[0])
-
-        self.updateStatus()
-
-    def noCookies(self):
-        t = _("There is no cookies!")
-        q = _("Do you want to add some ones?")
-        txt = t + "<p>" + q
-        reply = QMessageBox.question(self, _("Question"), txt,
-                                     QMessageBox.Yes | QMessageBox.No,
-                                     QMessageBox.No)
-        if reply == QMessageBox.Yes:
-            select = QFileDialog.getOpenFileName(self, 'Open file',
-                                               '/usr/share/games/fortunes')
-            self.loadFile(select[0], None, False, True)  # lang, offensive, saved
-            #self.loadFile('/usr/share/games/fortunes/fortunes', None, False, True)
-            self.elist = list(self.epigrams.keys())
-            self.nepigrams = len(self.elist)
-            random.shuffle(self.elist)
-            for i in range(self.nepigrams):
-                self.comboGoTo.addItem(str(i + 1))
+import re
+import sys
+import time
+import sqlite3
+import argparse
+
+sys.path.insert(1, "/usr/share/qfortune")  # Private modules
+from config import (PROGRAM_NAME, EXECUTABLE_NAME, VERSION, FORTUNE_DIRS,
+                    CACHE_DIR, SAVE_FILE, FAVORITES_DB, SERVER_SOCKET,
+                    SERVER_PORT, SHORT_LENGTH, CORPUS_DB)
+import cookiestore
+import selection
+import search
+import packfile
+import profiling
+
+
+def positive(text):
+    ''' argparse type of the numbers that must be 1 or more '''
+    try:
+        n = int(text)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError(_("must be 1 or more"))
+    return(n)
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(
+        prog=EXECUTABLE_NAME,
+        description=_("Prints a random fortune cookie. Without options the"
+                      " %s window is opened.") % PROGRAM_NAME)
+    parser.add_argument("sources", nargs="*", metavar="[N%] SOURCE",
+                        help=_("choose only from these languages or cookie"
+                               " files, N%% of the times if given"))
+    parser.add_argument("--print", action="store_true",
+                        help=_("print a random cookie (default with any"
+                               " other option)"))
+    parser.add_argument("--count", action="store_true",
+                        help=_("print how many cookies can be chosen"))
+    parser.add_argument("--file", action="append", metavar="FILE",
+                        help=_("choose only from this cookie file"))
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-a", dest="offensive", action="store_const",
+                       const=None, default=False,
+                       help=_("choose from all cookies, offensive or not"))
+    group.add_argument("-o", dest="offensive", action="store_const",
+                       const=True, help=_("choose only offensive cookies"))
+    parser.add_argument("-e", dest="equal", action="store_true",
+                        help=_("make all files equally likely"))
+    parser.add_argument("-c", dest="source", action="store_true",
+                        help=_("show the file the cookie comes from"))
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-s", dest="short", action="store_true",
+                       help=_("choose only short cookies"))
+    group.add_argument("-l", dest="long", action="store_true",
+                       help=_("choose only long cookies"))
+    parser.add_argument("-n", dest="length", type=int,
+                        default=SHORT_LENGTH,
+                        help=_("longest short cookie, in bytes"
+                               " (default: %(default)s)"))
+    parser.add_argument("-m", "--match", metavar="REGEX",
+                        help=_("print all the cookies matching a regular"
+                               " expression"))
+    parser.add_argument("-i", dest="ignorecase", action="store_true",
+                        help=_("ignore case for -m"))
+    parser.add_argument("--dedup-report", action="store_true",
+                        help=_("list the cookies found in more than one file"
+                               " (use -a to check offensive ones too)"))
+    parser.add_argument("--import-favorites", metavar="FILE",
+                        help=_("add the cookies of a file to the favorites"))
+    parser.add_argument("--export-favorites", metavar="FILE",
+                        help=_("write the favorites to a cookie file"))
+    parser.add_argument("--stats", action="store_true",
+                        help=_("print the files, load times, memory and"
+                               " latency of choosing cookies"))
+    parser.add_argument("--json", action="store_true",
+                        help=_("print --stats as JSON"))
+    parser.add_argument("--profile", metavar="FILE",
+                        help=_("save a cProfile dump of the run to FILE"))
+    parser.add_argument("--db", action="store_true",
+                        help=_("keep the cookies in a SQLite database,"
+                               " importing only the files that changed, and"
+                               " read them from there"))
+    parser.add_argument("--window", action="store_true",
+                        help=_("open the window (default without options)"))
+    parser.add_argument("--serve", action="store_true",
+                        help=_("load the cookies once and serve them on a"
+                               " UNIX socket and a local HTTP port"))
+    parser.add_argument("--port", type=int, default=SERVER_PORT,
+                        help=_("HTTP port of --serve, 0 for none"
+                               " (default: %(default)s)"))
+    parser.add_argument("--client", metavar="REQUEST",
+                        help=_("ask a running server, as \"random lang=es\","
+                               " \"get ID\", \"search WORDS\" or \"stats\""))
+    parser.add_argument("--build-index", action="store_true",
+                        help=_("read all the cookie files on every core and"
+                               " write their offset tables, search indexes"
+                               " and the corpus cache"))
+    parser.add_argument("--jobs", type=positive, metavar="N",
+                        help=_("processes of --build-index (default: one"
+                               " per core)"))
+    parser.add_argument("--pack", nargs=2, metavar=("SRC", "DEST"),
+                        help=_("compress the cookie files of the SRC tree"
+                               " into packs in the DEST tree"))
+    parser.add_argument("--pack-format", choices=packfile.formats(),
+                        default=".xz",
+                        help=_("compression of --pack (default:"
+                               " %(default)s)"))
+    parser.add_argument("--version", action="version",
+                        version=PROGRAM_NAME + " " + VERSION)
+    return(parser.parse_args(argv))
+
+
+def parseSources(args):
+    ''' Returns (source, percent or None) from "[N%] source" arguments '''
+    sources = []
+    percent = None
+    for arg in args:
+        if arg.endswith("%") and arg[:-1].isdigit():
+            percent = int(arg[:-1])
         else:
-            sys.exit()
-
-    def showCookie(self):
-        if len(self.elist) == 0:
-            self.noCookies()
-        self.cookie = self.epigrams[self.elist[self.index]][0]  # 0 is text
-        self.textEdit.setText(self.cookie)
-        self.updateInterface()
-
-    def createActions(self):
-        self.firstAct = QAction(QIcon.fromTheme('go-first'),
-                                _("&First"),
-                                self, shortcut=QKeySequence.MoveToStartOfLine,
-                                statusTip=_("Show first cookie"),
-                                triggered=self.firstCookie)
-
-        self.lastAct = QAction(QIcon.fromTheme('go-last'),
-                               _("&Last"),
-                               self, shortcut=QKeySequence.MoveToEndOfLine,
-                               statusTip=_("Show last cookie"),
-                               triggered=self.lastCookie)
-
-        self.nextAct = QAction(QIcon.fromTheme('go-next'),
-                               _("&Next"),
-                               self, shortcut=QKeySequence.MoveToNextPage,
-                               statusTip=_("Show next cookie"),
-                               triggered=self.nextCookie)
-
-        self.prevAct = QAction(QIcon.fromTheme('go-previous'),
-                               _("&Previous"),
-                               self, shortcut=QKeySequence.MoveToPreviousPage,
-                               statusTip=_("Show previous cookie"),
-                               triggered=self.prevCookie)
-
-        self.saveAct = QAction(QIcon.fromTheme('document-save'), _("&Save"),
-                               self, shortcut=QKeySequence.Save,
-                               statusTip=_("Save cookie to favorites"),
-                               triggered=self.saveCookie)
-
-        self.exitAct = QAction(QIcon.fromTheme('window-close'), _("E&xit"),
-                               self, shortcut=QKeySequence.Quit,
-                               statusTip=_("Exit the application"),
-                               triggered=self.close)
-
-        self.copyAct = QAction(QIcon.fromTheme('edit-copy'),
-                               _("&Copy"),
-                               self, shortcut=QKeySequence.Copy,
-                               statusTip=_("Copy cookie to the clipboard"),
-                               triggered=self.copyCookie)
-
-        self.aboutAct = QAction(QIcon.fromTheme(EXECUTABLE_NAME),
-                                _("&About") + " " + PROGRAM_NAME, self,
-                                statusTip=_("Information about"
-                                            " this application"),
-                                triggered=self.about)
-
-        self.aboutQtAct = QAction(QIcon.fromTheme('help-about'),
-                                  _("About &Qt"), self,
-                                  statusTip=_("Show information about"
-                                              " the Qt library"),
-                                  triggered=QApplication.instance().aboutQt)
-
-        self.openAct = QAction(QIcon.fromTheme('document-open'),
-                               _("&Open"),
-                               self, shortcut=QKeySequence.Open,
-                               statusTip=_("Open a cookie file"),
-                               triggered=self.loadFile)
-    def createMenus(self):
-        self.fileMenu = self.menuBar().addMenu(_("&File"))
-        self.fileMenu.addAction(self.openAct)
-        self.fileMenu.addAction(self.copyAct)
-        self.fileMenu.addAction(self.saveAct)
-        self.fileMenu.addSeparator()
-        self.fileMenu.addAction(self.exitAct)
-
-        self.editMenu = self.menuBar().addMenu(_("&Navigation"))
-        self.editMenu.addAction(self.prevAct)
-        self.editMenu.addAction(self.nextAct)
-        self.editMenu.addAction(self.firstAct)
-        self.editMenu.addAction(self.lastAct)
-
-        self.helpMenu = self.menuBar().addMenu(_("&Help"))
-        self.helpMenu.addAction(self.aboutAct)
-        self.helpMenu.addAction(self.aboutQtAct)
-
-    def createToolBars(self):
-        self.fileToolBar = self.addToolBar(_("File"))
-        self.fileToolBar.addAction(self.openAct)
-        self.fileToolBar.addAction(self.saveAct)
-        self.fileToolBar.addAction(self.copyAct)
-
-        self.navToolBar = self.addToolBar(_("Navigation"))
-        self.navToolBar.addAction(self.firstAct)
-        self.navToolBar.addAction(self.prevAct)
-        self.navToolBar.addAction(self.nextAct)
-        self.navToolBar.addAction(self.lastAct)
-        self.navToolBar.addWidget(self.comboGoTo)
-
-    def createStatusBar(self):
-        self.statusBar().addWidget(self.statusOrigin, Qt.AlignLeft)
-        self.statusBar().addWidget(self.statusOffensive, Qt.AlignRight)
-        self.statusBar().addWidget(self.statusSaved, Qt.AlignRight)
-        self.statusBar().addWidget(self.statusCopied, Qt.AlignRight)
-
-    def readSettings(self):
-        settings = QSettings(PROGRAM_NAME, _("Settings"))
-        size = settings.value("size", QSize(400, 300))
-        self.setWindowTitle(PROGRAM_NAME)
-        self.setWindowIcon(QIcon.fromTheme(EXECUTABLE_NAME))
-        self.resize(size)
-
-
-class AboutDialog(QWidget):
-    def __init__(self, parent=None):
-        super(AboutDialog, self).__init__(parent)
-
-        font = QFont()
-        font.setPointSize(18)
-        font.setBold(False)
-        labelIcon = QLabel()
-        pixmap = QIcon.fromTheme(EXECUTABLE_NAME).pixmap(QSize(64, 64))
-        labelIcon.setPixmap(pixmap)
-        labelText = QLabel(PROGRAM_NAME)
-        labelText.setFont(font)
-
-        tabWidget = QTabWidget()
-        tabWidget.addTab(AboutTab(), _("About"))
-        tabWidget.addTab(VersionTab(), _("Version"))
-        tabWidget.addTab(AuthorsTab(), _("Authors"))
-        tabWidget.addTab(ThanksTab(), _("Thanks"))
-        tabWidget.addTab(TranslationTab(), _("Translation"))
-
-        btn = QPushButton(_("Close"), self)
-        btn.setIcon(QIcon.fromTheme("window-close"))
-        btn.setToolTip(_("Close this window"))
-        btn.clicked.connect(self.close)
-
-        labelLayout = QHBoxLayout()
-        labelLayout.addWidget(labelIcon)
-        labelLayout.addWidget(labelText, Qt.AlignLeft)
-
-        mainLayout = QGridLayout()
-        mainLayout.addLayout(labelLayout, 0, 0)
-        mainLayout.addWidget(tabWidget, 1, 0)
-        mainLayout.addWidget(btn, 2, 0, Qt.AlignRight)
-        self.setLayout(mainLayout)
-
-        self.setWindowTitle(_("About") + " " + PROGRAM_NAME)
-        self.setWindowIcon(QIcon.fromTheme(EXECUTABLE_NAME))
-
-
-class AboutTab(QWidget):
-    def __init__(self, parent=None):
-        super(AboutTab, self).__init__(parent)
-
-        blank = QLabel()
-        description = QLabel(DESCRIPTION)
-        copyright = QLabel("© 2017, " + AUTHOR)
-        source = QLabel(_("Source:") + " "
-                        + "<a href='" + SOURCE + "'>" + SOURCE + "</a>")
-        license = QLabel(_("License:") + " "
-                         + "<a href='https://www.gnu.org/licenses/"
-                         "gpl-3.0.en.html'>"
-                         + _("GNU General Public License, version 3") + "</a>")
-
-        source.setTextInteractionFlags(Qt.TextBrowserInteraction)
-
-        mainLayout = QVBoxLayout()
-        mainLayout.addWidget(blank)
-        mainLayout.addWidget(blank)
-        mainLayout.addWidget(blank)
-        mainLayout.addWidget(description)
-        mainLayout.addWidget(blank)
-        mainLayout.addWidget(copyright)
-        mainLayout.addWidget(source)
-        mainLayout.addWidget(license)
-        mainLayout.addStretch()
-        self.setLayout(mainLayout)
-
-
-class VersionTab(QWidget):
-    def __init__(self, parent=None):
-        super(VersionTab, self).__init__(parent)
-
-        version = QLabel("<b>" + _("Version") + " " + VERSION + "<b>")
-        using = QLabel(_("Using:") + " ")
-        pyver = ".".join((
-            str(sys.version_info[0]),
-            str(sys.version_info[1]),
-            str(sys.version_info[2])))
-        python = QLabel("<ul><li>Python " + pyver)
-        pyqt = QLabel("<ul><li>PyQt " + QT_VERSION_STR)
-
-        mainLayout = QVBoxLayout()
-        mainLayout.addWidget(version)
-        mainLayout.addWidget(using)
-        mainLayout.addWidget(python)
-        mainLayout.addWidget(pyqt)
-        mainLayout.addStretch(1)
-        self.setLayout(mainLayout)
-
-
-class AuthorsTab(QWidget):
-    def __init__(self, parent=None):
-        super(AuthorsTab, self).__init__(parent)
-
-        blank = QLabel()
-        notice = QLabel(_("Mail me if you found bugs."))
-        name1 = QLabel("<b>" + AUTHOR + "<b>")
-        task1 = QLabel("<i>" + _("Principle author") + "</i>")
-        mail1 = QLabel("<pre>" + MAIL + "</pre>")
-
-        mainLayout = QVBoxLayout()
-        mainLayout.addWidget(notice)
-        mainLayout.addWidget(blank)
-        mainLayout.addWidget(name1)
-        mainLayout.addWidget(task1)
-        mainLayout.addWidget(mail1)
-        mainLayout.addStretch(1)
-        self.setLayout(mainLayout)
-
-
-class ThanksTab(QWidget):
-    def __init__(self, parent=None):
-        super(ThanksTab, self).__init__(parent)
-
-        blank = QLabel()
-        notice = QLabel(_("Thank you for using my program."))
-
-        mainLayout = QVBoxLayout()
-        mainLayout.addWidget(blank)
-        mainLayout.addWidget(notice)
-        mainLayout.addStretch(1)
-        self.setLayout(mainLayout)
-
-
-class TranslationTab(QWidget):
-    def __init__(self, parent=None):
-        super(TranslationTab, self).__init__(parent)
-
-        blank = QLabel()
-        notice = QLabel(_("Please, mail me if you want to") + " "
-                        + _("improve the translation."))
-        name1 = QLabel("<b>" + AUTHOR + "<b>")
-        task1 = QLabel("<i>" + _("Spanish and english translation") + "</i>")
-        mail1 = QLabel("<pre>" + MAIL + "</pre>")
-
-        mainLayout = QVBoxLayout()
-        mainLayout.addWidget(notice)
-        mainLayout.addWidget(blank)
-        mainLayout.addWidget(name1)
-        mainLayout.addWidget(task1)
-        mainLayout.addWidget(mail1)
-        mainLayout.addStretch(1)
-        self.setLayout(mainLayout)
+            sources.append((arg, percent))
+            percent = None
+    if percent is not None:
+        raise ValueError(_("A percentage must be followed by a source"))
+    return(sources)
+
+
+def chooseFiles(args, profile=None):
+    ''' Loads the store and returns it with the groups of file numbers to
+    choose from, as selection.fileWeights wants them. '''
+    sources = parseSources(args.sources + (args.file or []))
+    paths = [os.path.abspath(s) for s, p in sources if os.path.isfile(s)]
+    tree = not sources or len(paths) < len(sources)
+    if args.db:  # The tree is always there, or it would be removed
+        import corpusdb
+        store = corpusdb.loadCorpus(
+            FORTUNE_DIRS, CACHE_DIR, CORPUS_DB,
+            [(SAVE_FILE, None, False, True)]
+            + [(p, None, False, False) for p in paths if p != SAVE_FILE],
+            profile)
+    else:
+        store = cookiestore.loadCorpus(FORTUNE_DIRS if tree else [],
+                                       CACHE_DIR, profile=profile)
+        known = set(f[0] for f in store.files)
+        for path, table, lang, offensive, saved in cookiestore.loadFiles(
+                [(p, None, False, False) for p in paths if p not in known],
+                CACHE_DIR, profile=profile):
+            store.addFile(path, table, lang, offensive, saved)
+
+    if not sources:
+        files = store.selectFiles(args.offensive)
+        if args.db:  # It also keeps the favorites and the opened files
+            bases = tuple(os.path.join(b, "") for b in FORTUNE_DIRS)
+            files = [i for i in files if store.files[i][0].startswith(bases)]
+        return(store, [(files, None)])
+    groups = []
+    for source, percent in sources:
+        if os.path.isfile(source):  # Files asked for are always used
+            files = store.selectFiles(path=os.path.abspath(source))
+        else:
+            files = store.selectFiles(args.offensive, lang=source)
+            if not files:
+                raise ValueError(source + ": " + _("No such language or"
+                                                   " file"))
+        groups.append((files, percent))
+    return(store, groups)
+
+
+def manageFavorites(args):
+    ''' Imports or exports the favorites. Returns the exit status. '''
+    import favorites
+
+    try:
+        store = favorites.Favorites(FAVORITES_DB)
+        if not len(store) and os.path.isfile(SAVE_FILE):
+            store.importFile(SAVE_FILE)  # Older versions
+        if args.import_favorites:
+            n = store.importFile(args.import_favorites)
+            store.export(SAVE_FILE)
+            print(str(n) + " " + _("cookies imported"))
+        if args.export_favorites:
+            store.export(args.export_favorites)
+    except (OSError, sqlite3.Error) as e:
+        print(EXECUTABLE_NAME + ": " + str(e), file=sys.stderr)
+        return(1)
+    return(0)
+
+
+def dedupReport(store, files):
+    ''' Prints the cookies of files that are in more than one of them,
+    with their files, and how much could be saved removing the copies. '''
+    files = set(files)
+    groups = redundant = size = 0
+    for cid, copies in store.copies.items():
+        copies = [n for n in copies if store.fileid[n] in files]
+        if len(copies) < 2:
+            continue
+        groups += 1
+        redundant += len(copies) - 1
+        size += sum(store.textlen[n] for n in copies[1:])
+        print(store.text(copies[0]) + "\n%")
+        for n in copies:
+            print("  " + store.path(n), file=sys.stderr)
+    print(_("Cookies with copies:") + " " + str(groups), file=sys.stderr)
+    print(_("Redundant copies:") + " " + str(redundant), file=sys.stderr)
+    print(_("Redundant bytes:") + " " + str(size), file=sys.stderr)
+    return(0)
+
+
+def askServer(args):
+    ''' Prints the answer of a running server. Returns the exit status. '''
+    import json
+    import server
+
+    try:
+        answer = server.request(SERVER_SOCKET, args.client)
+    except (OSError, ValueError) as e:
+        print(EXECUTABLE_NAME + ": " + str(e), file=sys.stderr)
+        return(1)
+    if "error" in answer:
+        print(EXECUTABLE_NAME + ": " + answer["error"], file=sys.stderr)
+        return(1)
+    command = args.client.split()[0]
+    if command == "stats":
+        print(json.dumps(answer, indent=2))
+        return(0)
+    cookies = answer["cookies"] if command == "search" else [answer]
+    for cookie in cookies:
+        if args.source:
+            print("(" + ", ".join(cookie["sources"]) + ")\n%")
+        print(cookie["text"] + ("\n%" if command == "search" else ""))
+    return(0 if cookies else 1)
+
+
+def buildIndex(jobs):
+    ''' Indexes all the cookie files. Returns the exit status. '''
+    import indexer
+
+    try:
+        files, cookies, seconds = indexer.buildIndex(
+            FORTUNE_DIRS, CACHE_DIR, [(SAVE_FILE, None, False, True)], jobs)
+    except OSError as e:
+        print(EXECUTABLE_NAME + ": " + str(e), file=sys.stderr)
+        return(1)
+    print(_("%d files, %d cookies indexed in %.2f s") % (files, cookies,
+                                                         seconds))
+    return(0)
+
+
+def packTree(src, dest, ext):
+    ''' Packs the cookie files of a tree and prints their sizes. Returns
+    the exit status. '''
+    before = after = 0
+    try:
+        for path, target in packfile.packTree(src, dest, ext):
+            size, packed = os.path.getsize(path), os.path.getsize(target)
+            print("%10d %10d  %s" % (size, packed, target))
+            before += size
+            after += packed
+    except OSError as e:
+        print(EXECUTABLE_NAME + ": " + str(e), file=sys.stderr)
+        return(1)
+    print("%10d %10d  %s" % (before, after, _("total")))
+    return(0)
+
+
+def printStats(store, weights, profile, asjson=False):
+    ''' Draws a thousand cookies and prints the profile. Returns the exit
+    status. '''
+    import json
+
+    if any(w > 0 for f, w in weights):
+        selector = selection.Selector(store, weights)
+        for i in range(1000):
+            start = time.perf_counter()
+            store.text(selector.sample())
+            profile.addLatency(time.perf_counter() - start)
+    report = profile.report(store)
+    if asjson:
+        print(json.dumps(report, indent=2))
+    else:
+        print(profiling.formatReport(report))
+    return(0)
+
+
+def run(args):
+    ''' Runs the command line interface. Returns the exit status. '''
+    if args.import_favorites or args.export_favorites:
+        return(manageFavorites(args))
+    if args.client:
+        return(askServer(args))
+    if args.build_index:
+        return(buildIndex(args.jobs))
+    if args.pack:
+        return(packTree(args.pack[0], args.pack[1], args.pack_format))
+    if args.serve:
+        import server
+        return(server.serve(FORTUNE_DIRS, CACHE_DIR, SERVER_SOCKET,
+                            args.port, [(SAVE_FILE, None, False, True)]))
+
+    profile = profiling.Profile()
+    try:
+        store, groups = chooseFiles(args, profile)
+        weights = selection.fileWeights(store, groups, args.equal)
+    except ValueError as e:
+        print(EXECUTABLE_NAME + ": " + str(e), file=sys.stderr)
+        return(2)
+    except (OSError, sqlite3.Error) as e:  # Of the database
+        print(EXECUTABLE_NAME + ": " + str(e), file=sys.stderr)
+        return(1)
+    files = [f for f, w in weights if w > 0]
+
+    if args.stats or args.json:
+        return(printStats(store, weights, profile, args.json))
+    if args.dedup_report:
+        return(dedupReport(store, files))
+
+    shortmax = args.length if args.short else None
+    longmin = args.length if args.long else None
+
+    if args.match:
+        if args.db:
+            import corpusdb
+            index = corpusdb.TextSearch(store, files)
+        else:
+            index = search.SearchIndex(store, CACHE_DIR, files)
+        try:
+            found = index.match(args.match, re.IGNORECASE if args.ignorecase
+                                else 0)
+        except re.error as e:
+            print(EXECUTABLE_NAME + ": " + str(e), file=sys.stderr)
+            return(2)
+        found = [n for n in store.originals(found)
+                 if cookiestore.fitsLength(store, n, shortmax, longmin)]
+        for n in found:
+            print("(" + store.path(n) + ")\n%", file=sys.stderr)
+            print(store.text(n) + "\n%")
+        return(0 if found else 1)
+
+    if args.count:
+        print(sum(store.countLength(f, shortmax, longmin) for f in files))
+        return(0)
+
+    try:
+        n = selection.Selector(store, weights, shortmax=shortmax,
+                               longmin=longmin).sample()
+    except ValueError:
+        print(_("There is no cookies!"), file=sys.stderr)
+        return(1)
+    if args.source:
+        print("(" + store.path(n) + ")\n%")
+    print(store.text(n))
+    return(0)
+
+
+def main(argv):
+    args = parseArgs(argv[1:])
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            return(profiler.runcall(start, argv, args))
+        finally:
+            profiler.dump_stats(args.profile)
+    return(start(argv, args))
+
+
+def start(argv, args):
+    if len(argv) > 1 and not args.window:
+        return(run(args))
+
+    import window  # Qt is only loaded for the window
+    return(window.main(argv[:1], CORPUS_DB if args.db else None))
 
 
 if __name__ == '__main__':
-
-    import sys
-
-    app = QApplication(sys.argv)
-    mainWin = MainWindow()
-    aboutdialog = AboutDialog()
-    mainWin.show()
-    sys.exit(app.exec_())
+    sys.exit(main(sys.argv))
@@ -0,0 +1,230 @@
+''' Full-text search over the cookie store with an inverted index.
+
+Every cookie file gets an index, kept under the cache directory, that maps
+each word of its cookies to the numbers of the cookies where it is found.
+Words are folded (lower case, no accents), so "Canción" and "cancion" are
+the same word. A query word matches any indexed word that contains it.
+'''
+
+import os
+import re
+import struct
+import unicodedata
+from array import array
+
+import strfile
+import packfile
+import cookiestore
+import corpuscache
+
+MAGIC = b"QFSI"
+VERSION = 1
+
+HEADER = struct.Struct("=4sIqQQI")  # magic, version, mtime, size, inode,
+                                    # number of words
+WORD = struct.Struct("=HI")  # word length, number of cookies
+
+WORDS = re.compile(r"\w+")
+
+
+def fold(text):
+    ''' Lower case and without accents '''
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return("".join(c for c in text if not unicodedata.combining(c)))
+
+
+def words(text):
+    return(set(WORDS.findall(fold(text))))
+
+
+def pieces(word, longest=3):
+    ''' Returns the set of pieces of word up to longest letters long '''
+    return(set(word[i:i + n] for n in range(1, longest + 1)
+               for i in range(len(word) - n + 1)))
+
+
+def requiredWords(pattern):
+    ''' Returns folded words that any text matching the regular
+    expression pattern must contain, each inside one of its words. An
+    empty list means that nothing is known. '''
+    if any(c in pattern for c in "|()"):
+        return([])  # Alternatives and groups: too hard to tell
+    pattern = re.sub(r"\\.", " ", pattern)  # Escapes as \w or \.
+    pattern = re.sub(r"\[[^\]]*\]", " ", pattern)  # Character classes
+    pattern = re.sub(r"\w(\?|\*|\{[^}]*\})", " ", pattern)  # Optional chars
+    return(WORDS.findall(fold(pattern)))
+
+
+class FileIndex:
+    ''' Words of the cookies of one file: word -> local cookie numbers '''
+    def __init__(self, postings=None, key=None):
+        self.postings = postings or {}
+        self.key = key
+
+    @classmethod
+    def build(cls, store, fileid):
+        ''' Indexes a file of the store, streaming it from the disk '''
+        postings = {}
+        path = store.files[fileid][0]
+        rotated = store.filecount[fileid] and \
+            store.flags[store.filestart[fileid]] & cookiestore.ROTATED
+        try:
+            key = corpuscache.fileKey(path)
+            with packfile.openCookies(path) as f:
+                records = strfile.records(f, store.files[fileid][4])
+                for i, (offset, length, raw) in enumerate(records):
+                    text = raw.decode(errors="replace")
+                    if rotated:
+                        text = cookiestore.decrypt(text)
+                    for word in words(text):
+                        postings.setdefault(word, array("I")).append(i)
+        except OSError:
+            key = None
+        return(cls(postings, key))
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, mtime, size, inode, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Unknown index format")
+        postings = {}
+        pos = HEADER.size
+        for i in range(count):
+            length, n = WORD.unpack_from(data, pos)
+            pos += WORD.size
+            word = data[pos:pos + length].decode()
+            pos += length
+            numbers = array("I")
+            numbers.frombytes(data[pos:pos + n * numbers.itemsize])
+            pos += n * numbers.itemsize
+            postings[word] = numbers
+        return(cls(postings, (mtime, size, inode)))
+
+    def write(self, path):
+        chunks = [HEADER.pack(MAGIC, VERSION, self.key[0], self.key[1],
+                              self.key[2], len(self.postings))]
+        for word, numbers in sorted(self.postings.items()):
+            name = word.encode()
+            chunks.append(WORD.pack(len(name), len(numbers)))
+            chunks.append(name)
+            chunks.append(numbers.tobytes())
+        tmp = path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(chunks))
+        os.replace(tmp, path)
+
+
+def indexPath(path, cachedir):
+    name = os.path.abspath(path).strip(os.sep).replace(os.sep, "%") + ".idx"
+    return(os.path.join(cachedir, "search", name))
+
+
+def loadFileIndex(store, fileid, cachedir):
+    ''' Returns the index of a file of the store, from the cache when the
+    file did not change, building and saving it otherwise. '''
+    path = store.files[fileid][0]
+    idxfile = indexPath(path, cachedir)
+    try:
+        index = FileIndex.read(idxfile)
+        if index.key == corpuscache.fileKey(path):
+            return(index)
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        pass
+
+    index = FileIndex.build(store, fileid)
+    if index.key:
+        try:
+            os.makedirs(os.path.dirname(idxfile), exist_ok=True)
+            index.write(idxfile)
+        except OSError:
+            pass  # Works anyway, just slower next time
+    return(index)
+
+
+class SearchIndex:
+    ''' Index of all the files of a store '''
+    def __init__(self, store, cachedir, files=None):
+        self.store = store
+        self.postings = {}  # word: [(file number, local numbers), ...]
+        self.vocabulary = None  # The words, made on the first lookup
+        self.grams = None  # Piece of up to 3 letters: numbers of its words
+        if files is None:
+            files = store.selectFiles()
+        self.files = []  # Files in the index
+        for fileid in files:
+            self.addFile(fileid, loadFileIndex(store, fileid, cachedir))
+
+    def addFile(self, fileid, index):
+        self.vocabulary = self.grams = None  # Made again when needed
+        self.files.append(fileid)
+        for word, numbers in index.postings.items():
+            self.postings.setdefault(word, []).append((fileid, numbers))
+
+    def removeFile(self, fileid):
+        self.vocabulary = self.grams = None
+        for word, postings in list(self.postings.items()):
+            postings = [p for p in postings if p[0] != fileid]
+            if postings:
+                self.postings[word] = postings
+            else:
+                del self.postings[word]
+        if fileid in self.files:
+            self.files.remove(fileid)
+
+    def matching(self, word):
+        ''' Returns the indexed words containing word. Those up to 3
+        letters long are pieces of the words; longer ones are looked for
+        only in the words with their rarest piece of 3. '''
+        if self.grams is None:
+            self.vocabulary = list(self.postings)
+            self.grams = {}
+            for i, indexed in enumerate(self.vocabulary):
+                for gram in pieces(indexed):
+                    self.grams.setdefault(gram, array("I")).append(i)
+        vocabulary = self.vocabulary
+        if len(word) <= 3:
+            return([vocabulary[i] for i in self.grams.get(word, ())])
+        rarest = min((self.grams.get(word[i:i + 3], ())
+                      for i in range(len(word) - 2)), key=len)
+        return([vocabulary[i] for i in rarest if word in vocabulary[i]])
+
+    def lookup(self, word):
+        ''' Returns the set of cookies with a word containing word '''
+        byfile = {}  # File number: local numbers of every word
+        for indexed in self.matching(word):
+            for fileid, numbers in self.postings[indexed]:
+                byfile.setdefault(fileid, []).append(numbers)
+        found = set()
+        filestart = self.store.filestart
+        for fileid, lists in byfile.items():
+            found.update(map(filestart[fileid].__add__, set().union(*lists)))
+        return(found)
+
+    def find(self, query):
+        ''' Returns the sorted numbers of the cookies with all the words of
+        query '''
+        found = None
+        for word in sorted(set(WORDS.findall(fold(query))), key=len,
+                           reverse=True):
+            cookies = self.lookup(word)
+            found = cookies if found is None else found & cookies
+            if not found:
+                break
+        return(sorted(found or []))
+
+    def match(self, pattern, flags=0):
+        ''' Returns the sorted numbers of the cookies matching the regular
+        expression pattern. The index narrows the cookies to check. '''
+        regex = re.compile(pattern, flags)
+        required = requiredWords(pattern)
+        if required:
+            candidates = self.find(" ".join(required))
+        else:
+            candidates = [n for fileid in self.files
+                          for n in range(self.store.filestart[fileid],
+                                         self.store.filestart[fileid]
+                                         + self.store.filecount[fileid])]
+        return([n for n in candidates if regex.search(self.store.text(n))])
+
@@ -0,0 +1,198 @@
+''' Random choice of cookies without shuffling the whole store.
+
+A random cookie is drawn in constant time by picking a file from an alias
+table built over the per-file counts and then a cookie inside it. The
+navigation order of the window is a pseudorandom permutation of the store,
+computed position by position, so it never has to be built in memory.
+'''
+
+import random
+
+
+class AliasTable:
+    ''' Walker's alias method: constant time draws from a discrete
+    distribution given by weights. '''
+    def __init__(self, weights, rand=random):
+        self.rand = rand
+        n = len(weights)
+        self.n = n
+        total = float(sum(weights))
+        if not n or total <= 0:
+            raise ValueError("Nothing to choose from")
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+        for i in small + large:  # Left overs by rounding
+            self.prob[i] = 1.0
+
+    def sample(self):
+        i = self.rand.randrange(self.n)
+        if self.rand.random() < self.prob[i]:
+            return(i)
+        return(self.alias[i])
+
+
+class Selector:
+    ''' Draws cookies of a store. The files to choose from and their
+    weights are given as a list of (file number, weight).
+
+    With shortmax or longmin only cookies that fit those limits (see
+    cookiestore.fitsLength) are drawn, all of a file equally likely. The
+    weight of a file is scaled by the share of its cookies that fit, and
+    a draw is still a file and a place in its cookies sorted by length. '''
+    def __init__(self, store, weights, rand=random, shortmax=None,
+                 longmin=None):
+        self.store = store
+        self.rand = rand
+        self.files = []
+        self.ranges = []  # Cookies sorted by length, start and end of
+                          # those that fit, for every file
+        fitting = []
+        for f, w in weights:
+            if w > 0 and store.filecount[f]:
+                order, start, end = store.lengthRange(f, shortmax, longmin)
+                if end > start:
+                    self.files.append(f)
+                    self.ranges.append((order, start, end))
+                    fitting.append(w * (end - start) / store.filecount[f])
+        self.table = AliasTable(fitting, rand)
+
+    def sample(self):
+        ''' Returns the number of a random cookie '''
+        i = self.table.sample()
+        order, start, end = self.ranges[i]
+        return(self.store.filestart[self.files[i]]
+               + order[start + self.rand.randrange(end - start)])
+
+
+def fileWeights(store, groups, equal=False):
+    ''' Returns (file number, weight) for groups of files, a list of
+    (file numbers, percent or None).
+
+    Every cookie is equally likely, or every file if equal is true. A group
+    with a percent gets that share of the draws, and the rest is shared by
+    the groups without it, as fortune(6) does with "N% file" arguments. '''
+    def weight(f):
+        return(1 if equal else store.filecount[f])
+
+    groups = [([f for f in files if store.filecount[f]], percent)
+              for files, percent in groups]
+    groups = [g for g in groups if g[0]]
+    fixed = sum(percent for files, percent in groups if percent is not None)
+    if fixed > 100:
+        raise ValueError("Percentages add up to more than 100%")
+    freeweight = sum(weight(f) for files, percent in groups
+                     if percent is None for f in files)
+
+    weights = []
+    for files, percent in groups:
+        if percent is None:
+            share = (100 - fixed) / freeweight
+        else:
+            share = percent / sum(weight(f) for f in files)
+        weights.extend((f, share * weight(f)) for f in files)
+    return(weights)
+
+
+class Mapped:
+    ''' The sequence values[indexes[i]], computed on demand '''
+    def __init__(self, indexes, values):
+        self.indexes = indexes
+        self.values = values
+
+    def __len__(self):
+        return(len(self.indexes))
+
+    def __getitem__(self, i):
+        return(self.values[self.indexes[i]])
+
+
+class Permutation:
+    ''' A random order of range(n) computed on demand.
+
+    A small Feistel network over the next power of four is walked until it
+    falls inside range(n) (cycle walking), which gives a bijection with
+    constant expected time per position and no memory per element. Some
+    positions can be pinned to a given value; the value that was there
+    moves to where the pinned one was. '''
+    rounds = 4
+
+    def __init__(self, n, seed=None, pins={}):
+        self.n = n
+        bits = max((n - 1).bit_length(), 2)
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        rand = random.Random(seed)
+        self.keys = [rand.getrandbits(32) for i in range(self.rounds)]
+        self.pos = {}  # Pinned position: value
+        self.inv = {}  # Pinned value: position
+        for p, x in pins.items():
+            if p < n and x < n:
+                self.pin(p, x)
+
+    def __len__(self):
+        return(self.n)
+
+    def round(self, r, key):
+        h = (r * 0x9E3779B1 + key) & 0xffffffff
+        h ^= h >> 15
+        h = (h * 0x2C1B3C6D) & 0xffffffff
+        h ^= h >> 12
+        return(h & self.mask)
+
+    def encrypt(self, x):
+        left, right = x >> self.half, x & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self.round(right, key)
+        return((left << self.half) | right)
+
+    def decrypt(self, x):
+        left, right = x >> self.half, x & self.mask
+        for key in reversed(self.keys):
+            left, right = right ^ self.round(left, key), left
+        return((left << self.half) | right)
+
+    def __getitem__(self, p):
+        if p < 0:
+            p += self.n
+        if not 0 <= p < self.n:
+            raise IndexError("Permutation index out of range")
+        if p in self.pos:
+            return(self.pos[p])
+        x = self.encrypt(p)
+        while x >= self.n:
+            x = self.encrypt(x)
+        return(x)
+
+    def index(self, x):
+        ''' Returns the position of value x '''
+        if x in self.inv:
+            return(self.inv[x])
+        p = self.decrypt(x)
+        while p >= self.n:
+            p = self.decrypt(p)
+        return(p)
+
+    def pin(self, p, x):
+        ''' Puts value x at position p '''
+        q = self.index(x)
+        if q == p:
+            return
+        y = self[p]
+        self.pos[p] = x
+        self.inv[x] = p
+        self.pos[q] = y
+        self.inv[y] = q
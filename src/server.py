@@ -0,0 +1,312 @@
+''' A local cookie server, so other programs get cookies without loading
+the corpus every time.
+
+The corpus is loaded once and requests are answered over a UNIX socket
+and, on the loopback interface only, over HTTP. A request is a line with
+a command, key=value parameters and words:
+
+    random [lang=L] [offensive=0|1|all] [file=PATH] [short=N|long=N]
+    get ID
+    search WORDS... [limit=N]
+    stats
+
+The answer is a line of JSON. Over HTTP the same requests are
+GET /random?lang=es&short=160, GET /get/ID, GET /search?q=WORDS and GET /stats.
+Cookies are identified by their content id, which does not change when
+the corpus is loaded again. SIGHUP loads the corpus again while the
+server keeps answering with the old one.
+'''
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import urllib.parse
+
+import cookiestore
+import selection
+import search
+
+COMMANDS = ("random", "get", "search", "stats")
+
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed"}
+
+
+class RequestError(Exception):
+    def __init__(self, message, status=400):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+
+def parseRequest(line):
+    ''' Returns command, parameters and words of a request line '''
+    params = {}
+    words = []
+    for token in line.split():
+        key, sep, value = token.partition("=")
+        if sep:
+            params[key] = value
+        else:
+            words.append(token)
+    if not words:
+        raise RequestError("Empty request")
+    return(words[0], params, words[1:])
+
+
+def parseHTTP(target):
+    ''' Returns command, parameters and words of an HTTP request target '''
+    url = urllib.parse.urlsplit(target)
+    parts = [urllib.parse.unquote(p) for p in url.path.split("/") if p]
+    params = dict(urllib.parse.parse_qsl(url.query))
+    if not parts:
+        raise RequestError("Empty request", 404)
+    words = parts[1:] + params.pop("q", "").split()
+    return(parts[0], params, words)
+
+
+class Corpus:
+    ''' A loaded store with what is needed to answer requests '''
+    def __init__(self, bases, cachedir, extra=[]):
+        self.store = cookiestore.loadCorpus(bases, cachedir, extra)
+        self.index = search.SearchIndex(self.store, cachedir)
+        self.selectors = {}  # (offensive, lang, path, shortmax, longmin):
+                             # Selector
+        self.loaded = time.time()
+
+    def selector(self, offensive, lang, path, shortmax=None, longmin=None):
+        key = (offensive, lang, path, shortmax, longmin)
+        if key not in self.selectors:
+            files = self.store.selectFiles(offensive, lang, path)
+            weights = selection.fileWeights(self.store, [(files, None)])
+            try:
+                self.selectors[key] = selection.Selector(
+                    self.store, weights, shortmax=shortmax, longmin=longmin)
+            except ValueError:
+                self.selectors[key] = None  # No cookies
+        return(self.selectors[key])
+
+    def cookie(self, n):
+        store = self.store
+        return({"id": "%016x" % store.cid[n], "text": store.text(n),
+                "sources": store.sources(n), "lang": store.lang(n),
+                "offensive": store.isOffensive(n)})
+
+    def close(self):
+        self.store.close()
+
+
+class CookieServer:
+    def __init__(self, bases, cachedir, extra=[]):
+        self.bases = bases
+        self.cachedir = cachedir
+        self.extra = extra
+        self.corpus = Corpus(bases, cachedir, extra)
+        self.started = time.time()
+        self.reloading = False
+        self.counts = {}  # Command: requests
+        self.times = {}  # Command: total seconds
+        self.slowest = {}  # Command: seconds of the slowest request
+
+    def answer(self, command, params, words):
+        ''' Returns the answer to a request as a dict '''
+        corpus = self.corpus  # The same one for the whole request
+        store = corpus.store
+        if command == "random":
+            offensive = {"0": False, "1": True, "all": None}.get(
+                params.get("offensive", "0"), False)
+            try:
+                shortmax, longmin = (
+                    None if params.get(p) is None else int(params[p])
+                    for p in ("short", "long"))
+            except ValueError:
+                raise RequestError("Bad length")
+            selector = corpus.selector(offensive, params.get("lang"),
+                                       params.get("file"), shortmax, longmin)
+            if selector is None:
+                raise RequestError("There is no cookies", 404)
+            return(corpus.cookie(selector.sample()))
+        if command == "get":
+            try:
+                slot = store.ids[int(words[0], 16)]
+            except (IndexError, ValueError, KeyError):
+                raise RequestError("No such cookie", 404)
+            return(corpus.cookie(store.unique[slot]))
+        if command == "search":
+            found = store.originals(corpus.index.find(" ".join(words)))
+            try:
+                limit = int(params.get("limit", 20))
+            except ValueError:
+                raise RequestError("Bad limit")
+            return({"count": len(found),
+                    "cookies": [corpus.cookie(n) for n in found[:limit]]})
+        if command == "stats":
+            return(self.stats())
+        raise RequestError("Unknown command: " + command, 404)
+
+    def handle(self, command, params, words):
+        ''' Answers a request and counts it. Returns status and answer. '''
+        start = time.perf_counter()
+        try:
+            status, answer = 200, self.answer(command, params, words)
+        except RequestError as e:
+            status, answer = e.status, {"error": str(e)}
+        if command in COMMANDS:
+            elapsed = time.perf_counter() - start
+            self.counts[command] = self.counts.get(command, 0) + 1
+            self.times[command] = self.times.get(command, 0) + elapsed
+            self.slowest[command] = max(self.slowest.get(command, 0),
+                                        elapsed)
+        return(status, answer)
+
+    def stats(self):
+        uptime = time.time() - self.started
+        requests = {}
+        for command, count in self.counts.items():
+            requests[command] = {
+                "count": count,
+                "mean_ms": self.times[command] * 1000 / count,
+                "max_ms": self.slowest[command] * 1000}
+        return({"uptime": uptime,
+                "loaded": self.corpus.loaded,
+                "files": len(self.corpus.store.selectFiles()),
+                "cookies": len(self.corpus.store.unique),
+                "requests_per_second": sum(self.counts.values()) / uptime,
+                "requests": requests})
+
+    async def reload(self):
+        ''' Loads the corpus again in a thread and then replaces it '''
+        if self.reloading:
+            return
+        self.reloading = True
+        try:
+            loop = asyncio.get_running_loop()
+            corpus = await loop.run_in_executor(
+                None, Corpus, self.bases, self.cachedir, self.extra)
+            old, self.corpus = self.corpus, corpus
+            old.close()
+        finally:
+            self.reloading = False
+
+    async def serveLines(self, reader, writer):
+        ''' Answers request lines until the client closes '''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = parseRequest(line.decode())
+                except (RequestError, UnicodeDecodeError) as e:
+                    status, answer = 400, {"error": str(e)}
+                else:
+                    status, answer = self.handle(*request)
+                writer.write(json.dumps(answer).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serveHTTP(self, reader, writer):
+        ''' Answers one HTTP GET request '''
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            method, target, version = head.split(b"\r\n")[0].decode(
+                "latin-1").split(" ", 2)
+            if method != "GET":
+                status, answer = 405, {"error": "Only GET"}
+            else:
+                try:
+                    status, answer = self.handle(*parseHTTP(target))
+                except RequestError as e:
+                    status, answer = e.status, {"error": str(e)}
+            body = json.dumps(answer).encode()
+            writer.write(("HTTP/1.0 %d %s\r\n"
+                          "Content-Type: application/json; charset=utf-8\r\n"
+                          "Content-Length: %d\r\n"
+                          "Connection: close\r\n\r\n"
+                          % (status, HTTP_STATUS[status], len(body))).encode()
+                         + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, path, port=None):
+        ''' Serves on the UNIX socket path and, if port is given, on
+        that port of the loopback interface, until SIGINT or SIGTERM '''
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGHUP,
+                                lambda: loop.create_task(self.reload()))
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            if isListening(path):
+                raise OSError(path + ": another server is running")
+            os.remove(path)  # Left by a server that was killed
+        servers = []
+        try:
+            servers.append(await asyncio.start_unix_server(self.serveLines,
+                                                           path))
+            os.chmod(path, 0o600)
+            if port:
+                servers.append(await asyncio.start_server(
+                    self.serveHTTP, "127.0.0.1", port))
+            await stop.wait()
+        finally:
+            for server in servers:
+                server.close()
+                await server.wait_closed()
+            if servers:  # The socket is this one's
+                os.remove(path)
+            self.corpus.close()
+
+
+def isListening(path):
+    ''' Returns whether a server answers on the UNIX socket path '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            return(False)
+    return(True)
+
+
+def serve(bases, cachedir, path, port=None, extra=[]):
+    ''' Loads the corpus and serves it. Returns the exit status. '''
+    if isListening(path):  # Before loading it all for nothing
+        print(path + ": another server is running", file=sys.stderr)
+        return(1)
+    try:
+        server = CookieServer(bases, cachedir, extra)
+        asyncio.run(server.run(path, port))
+    except OSError as e:
+        print(str(e), file=sys.stderr)
+        return(1)
+    return(0)
+
+
+def request(path, line, timeout=5):
+    ''' Sends a request line to the server of the UNIX socket path and
+    returns its answer '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(line.strip().encode() + b"\n")
+        s.shutdown(socket.SHUT_WR)
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return(json.loads(data.decode()))
@@ -0,0 +1,188 @@
+''' Offset tables for fortune cookie files, compatible with strfile(8).
+
+A table (.dat file) holds a header with the number of cookies, the longest
+and shortest cookie lengths and some flags, followed by the byte offset of
+every cookie in the source file and a last offset pointing to its end.
+With it a cookie can be read with a single seek instead of parsing the
+whole file.
+'''
+
+import os
+import struct
+
+STRFILE_VERSION = 2
+
+STR_RANDOM = 0x1  # Randomized pointers
+STR_ORDERED = 0x2  # Ordered pointers
+STR_ROTATED = 0x4  # Strings are rot13 encoded
+STR_COMMENTS = 0x8  # Embedded comments
+
+HEADER = struct.Struct(">IIIIIc3x")  # version, numstr, longlen, shortlen,
+                                     # flags, delim
+OFFSET = struct.Struct(">I")
+
+
+class Strfile:
+    ''' Offset table of a cookie file. '''
+    def __init__(self, offsets, longlen=0, shortlen=0, flags=0, delim=b"%",
+                 ids=None, chunks=None, lengths=None, order=None):
+        self.offsets = offsets  # Start of every cookie plus end of file
+        self.ids = ids  # Content ids of the cookies; not saved in .dat
+        self.lengths = lengths  # Bytes of their texts; not saved in .dat
+        self.order = order  # Their numbers by length; not saved in .dat
+        self.chunks = chunks  # Member index of packs; not saved in .dat
+        self.numstr = len(offsets) - 1
+        self.longlen = longlen
+        self.shortlen = shortlen
+        self.flags = flags
+        self.delim = delim
+
+    def isRotated(self):
+        return(bool(self.flags & STR_ROTATED))
+
+    def read(self, f, n):
+        ''' Returns the raw bytes of the cookie number n of the open file f '''
+        start = self.offsets[n]
+        f.seek(start)
+        return(cut(f.read(self.offsets[n + 1] - start), self.delim))
+
+    def write(self, path):
+        ''' Saves the table to path in strfile(8) format '''
+        tmp = path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(STRFILE_VERSION, self.numstr, self.longlen,
+                                self.shortlen, self.flags, self.delim))
+            for offset in self.offsets:
+                f.write(OFFSET.pack(offset))
+        os.replace(tmp, path)
+
+
+def cut(chunk, delim=b"%"):
+    ''' Removes the delimiter lines and what follows them from a chunk '''
+    lines = chunk.split(b"\n")
+    for i, line in enumerate(lines):
+        if line.rstrip(b"\r") == delim:
+            lines = lines[:i]
+            break
+    return(b"\n".join(lines).rstrip(b"\r\n"))
+
+
+def records(f, delim=b"%", text=True, chunksize=1 << 16):
+    ''' Yields offset, length and bytes of every cookie of the open binary
+    file f, reading it by chunks so it is never whole in memory. Lengths
+    and bytes leave out the trailing line breaks; the bytes are None when
+    text is false. Delimiter lines may end in LF, CRLF or nothing. '''
+    start = 0  # Start of the cookie being scanned
+    end = 0  # End of its text, without trailing line breaks
+    pos = 0  # Start of the line being scanned
+    parts = []  # Lines of the cookie being scanned
+    rest = b""  # Incomplete line at the end of the last chunk
+    while True:
+        chunk = f.read(chunksize)
+        if chunk:
+            lines = (rest + chunk).split(b"\n")
+            rest = lines.pop()
+            lines = [line + b"\n" for line in lines]
+        else:
+            lines = [rest] if rest else []
+        for line in lines:
+            stripped = line.rstrip(b"\r\n")
+            if stripped == delim:
+                if end > start:  # Empty cookies are skipped
+                    yield(start, end - start,
+                          b"".join(parts)[:end - start] if text else None)
+                start = end = pos + len(line)
+                parts = []
+            else:
+                if stripped:
+                    end = pos + len(stripped)
+                if text:
+                    parts.append(line)
+            pos += len(line)
+        if not chunk:
+            break
+    if end > start:
+        yield(start, end - start,
+              b"".join(parts)[:end - start] if text else None)
+
+
+def build(path, rotated=False, delim=b"%", visit=None):
+    ''' Scans a cookie file and returns its offset table '''
+    with open(path, "rb") as f:
+        return(scan(f, rotated, delim, visit))
+
+
+def scan(f, rotated=False, delim=b"%", visit=None):
+    ''' Returns the offset table of the cookies of the open file f. visit,
+    if given, is called with the number, length and bytes of every cookie,
+    so they can be used in the same reading. '''
+    offsets = []
+    longlen = 0
+    shortlen = 0xffffffff
+    for offset, length, text in records(f, delim, visit is not None):
+        if visit is not None:
+            visit(len(offsets), length, text)
+        offsets.append(offset)
+        longlen = max(longlen, length)
+        shortlen = min(shortlen, length)
+    offsets.append(f.tell())
+    if len(offsets) == 1:
+        shortlen = 0
+
+    flags = STR_ROTATED if rotated else 0
+    return(Strfile(offsets, longlen, shortlen, flags, delim))
+
+
+def read(path):
+    ''' Loads an offset table from a .dat file '''
+    with open(path, "rb") as f:
+        data = f.read()
+    (version, numstr, longlen, shortlen,
+     flags, delim) = HEADER.unpack_from(data)
+    if version > STRFILE_VERSION:
+        raise ValueError(path + ": unknown strfile version")
+    n = numstr + 1
+    offsets = list(struct.unpack_from(">" + str(n) + "I", data, HEADER.size))
+    if flags & (STR_RANDOM | STR_ORDERED):  # Back to file order
+        offsets.sort()
+        flags &= ~(STR_RANDOM | STR_ORDERED)
+    return(Strfile(offsets, longlen, shortlen, flags, delim))
+
+
+def isFresh(path, datfile):
+    ''' True if datfile is newer than path '''
+    try:
+        return(os.stat(datfile).st_mtime >= os.stat(path).st_mtime)
+    except OSError:
+        return(False)
+
+
+def datPath(path, cachedir):
+    ''' Where the table of path is kept when it can not be beside it '''
+    name = os.path.abspath(path).strip(os.sep).replace(os.sep, "%") + ".dat"
+    return(os.path.join(cachedir, name))
+
+
+def load(path, cachedir, rotated=False, visit=None):
+    ''' Returns the offset table of path, building it if it is missing or
+    stale. A table beside the cookie file (as strfile(8) leaves it) is
+    preferred; otherwise it is kept in cachedir. visit is as in scan(),
+    only called when the table is built. '''
+    size = os.path.getsize(path)
+    for datfile in path + ".dat", datPath(path, cachedir):
+        if isFresh(path, datfile):
+            try:
+                table = read(datfile)
+            except (OSError, ValueError, struct.error):
+                continue
+            if table.offsets[-1] == size:
+                return(table)
+
+    table = build(path, rotated, visit=visit)
+    datfile = datPath(path, cachedir)
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        table.write(datfile)
+    except OSError:
+        pass  # Works anyway, just slower next time
+    return(table)
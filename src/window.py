@@ -0,0 +1,1224 @@
+''' The Qt interface of qfortune. '''
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+from collections import OrderedDict
+
+from PyQt5.QtCore import (QAbstractListModel, QFileSystemWatcher,
+                          QModelIndex, QSettings, QSize, QThread, QTimer, Qt,
+                          QT_VERSION_STR, pyqtSignal)
+from PyQt5.QtGui import (QIcon, QKeySequence, QFont, QFontDatabase,
+                         QIntValidator, QTextDocument)
+from PyQt5.QtWidgets import (QWidget, QAction, QActionGroup,
+                             QApplication, QComboBox,
+                             QMainWindow, QLabel, QFileDialog,
+                             QTabWidget, QGridLayout, QVBoxLayout,
+                             QHBoxLayout, QMessageBox, QTextEdit, QPushButton,
+                             QLineEdit)
+
+import packfile
+import cookiestore
+import corpuscache
+import selection
+import search
+import corpusdb
+import favorites
+import profiling
+from config import (PROGRAM_NAME, EXECUTABLE_NAME, DESCRIPTION, VERSION,
+                    AUTHOR, MAIL, SOURCE, FORTUNE_DIRS, SAVE_BASE, SAVE_FILE,
+                    FAVORITES_DB, CACHE_DIR, SHORT_LENGTH)
+
+
+class NumberModel(QAbstractListModel):
+    ''' Cookie numbers for comboGoTo. Labels are made when Qt asks for
+    them, so the size of the corpus does not matter. '''
+    def __init__(self, parent=None):
+        super(NumberModel, self).__init__(parent)
+        self.count = 0
+
+    def setCount(self, count):
+        ''' Rows are inserted or removed, not reset, so comboGoTo keeps
+        its current index while cookies are being loaded. '''
+        if count > self.count:
+            self.beginInsertRows(QModelIndex(), self.count, count - 1)
+            self.count = count
+            self.endInsertRows()
+        elif count < self.count:
+            self.beginRemoveRows(QModelIndex(), count, self.count - 1)
+            self.count = count
+            self.endRemoveRows()
+
+    def rowCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return(0)
+        return(self.count)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role in (Qt.DisplayRole, Qt.EditRole) and index.isValid():
+            return(str(index.row() + 1))
+        return(None)
+
+
+class RenderCache:
+    ''' Laid out documents of the cookies shown or about to be. The least
+    recently used one goes when there are too many. '''
+    def __init__(self, view, size=32):
+        self.view = view  # QTextEdit that shows them
+        self.size = size
+        self.documents = OrderedDict()  # Cookie number: QTextDocument
+
+    def __contains__(self, n):
+        return(n in self.documents)
+
+    def document(self, n, text):
+        doc = self.documents.get(n)
+        if doc is not None:
+            self.documents.move_to_end(n)
+            return(doc)
+        doc = QTextDocument(self.view)
+        doc.setUndoRedoEnabled(False)
+        doc.setDefaultFont(self.view.font())
+        doc.setPlainText(text)  # Never taken as HTML
+        doc.setTextWidth(self.view.viewport().width())
+        doc.size()  # Lays it out now
+        self.documents[n] = doc
+        while len(self.documents) > self.size:
+            old = next(iter(self.documents))
+            if self.documents[old] is self.view.document():
+                self.documents.move_to_end(old)  # Still shown
+                continue
+            self.documents.pop(old).deleteLater()
+        return(doc)
+
+
+class Loader(QThread):
+    ''' Finds the cookie files and reads their offset tables out of the
+    GUI thread. Every file is handed over as soon as it is ready. Tables
+    of unchanged files come from the corpus cache. '''
+    loaded = pyqtSignal(str, object, object, bool, bool)  # path, table, lang,
+                                                          # offensive, saved
+
+    def __init__(self, bases, extra, cachedir, profile, parent=None):
+        super(Loader, self).__init__(parent)
+        self.profile = profile
+        self.bases = bases
+        self.extra = extra  # (path, lang, offensive, saved) loaded at last
+        self.cachedir = cachedir
+        self.cache = corpuscache.CorpusCache(os.path.join(cachedir,
+                                                          "corpus.cache"))
+
+    def run(self):
+        profile = self.profile
+        with profile.phase("cache load"):
+            self.cache.load()
+        with profile.phase("discovery"):
+            files = self.loadOrder([f + (False,) for f
+                                    in cookiestore.findFiles(self.bases)])
+        with profile.phase("parse"):
+            for loaded in cookiestore.loadFiles(files, self.cachedir,
+                                                self.cache, profile):
+                if self.isInterruptionRequested():
+                    break
+                self.loaded.emit(*loaded)
+            else:
+                with profile.phase("cache save"):
+                    self.cache.save()
+        profile.mark("loaded")
+
+    def loadOrder(self, found):
+        ''' Returns the found files small first, then the extra ones, with
+        one moved to the front, chosen with a chance proportional to its
+        number of cookies. The first cookie is shown when that file alone
+        is loaded, so it is as likely to be any cookie of the corpus. The
+        counts of the files not in the cache are guessed from their
+        sizes; a file that is gone counts as empty. '''
+        sizes = {}
+        for f in found + self.extra:
+            try:
+                sizes[f[0]] = os.path.getsize(f[0])
+            except OSError:
+                sizes[f[0]] = 0
+        files = sorted(found, key=lambda f: sizes[f[0]]) + self.extra
+        cached = [(key[1], table.numstr) for key, table
+                  in self.cache.entries.values()]
+        ratio = (sum(c[1] for c in cached) / sum(c[0] for c in cached)
+                 if sum(c[0] for c in cached) else 1)
+        weights = []
+        for f in files:
+            entry = self.cache.entries.get(f[0])
+            if entry and sizes[f[0]]:
+                weights.append(entry[1].numstr)
+            else:
+                weights.append(sizes[f[0]] * ratio)
+        if not sum(weights):
+            return(files)
+        i = random.choices(range(len(files)), weights)[0]
+        return([files[i]] + files[:i] + files[i + 1:])
+
+
+class DBLoader(QThread):
+    ''' Imports the new and changed cookie files into the database out of
+    the GUI thread, and removes the ones that are gone. '''
+    def __init__(self, bases, extra, cachedir, dbpath, profile, parent=None):
+        super(DBLoader, self).__init__(parent)
+        self.profile = profile
+        self.bases = bases
+        self.extra = extra
+        self.cachedir = cachedir
+        self.dbpath = dbpath
+        self.changed = False  # Whether the database changed
+
+    def run(self):
+        with self.profile.phase("discovery"):
+            files = [f + (False,) for f in cookiestore.findFiles(self.bases)]
+        with self.profile.phase("import"):
+            try:
+                corpus = corpusdb.CorpusDB(self.dbpath)
+                try:
+                    self.changed = any(corpus.update(
+                        files + self.extra, self.cachedir,
+                        self.isInterruptionRequested, self.bases,
+                        self.profile))
+                finally:
+                    corpus.close()
+            except (OSError, sqlite3.Error):
+                pass  # The cookies imported before are still there
+        self.profile.mark("loaded")
+
+
+class MainWindow(QMainWindow):
+    def __init__(self, db=None):
+        super(MainWindow, self).__init__()
+        self.profile = profiling.Profile()  # Times, for the statistics
+        self.statsDialog = None
+
+        self.db = db  # Path of the SQLite database, if the cookies are
+                      # kept there instead of in memory
+        self.opened = []  # Files opened with the dialog, for the database
+        if db:
+            self.store = corpusdb.DBStore(corpusdb.CorpusDB(db))
+        else:
+            self.store = cookiestore.CookieStore()  # All fortune cookies
+        self.seed = random.getrandbits(64)
+        self.order = selection.Mapped(  # Navigation order, without copies
+            selection.Permutation(0, self.seed), self.store.unique)
+        self.seen = {}  # Shown positions of order and their unique numbers
+        self.elist = self.order  # Cookies being navigated: order or found
+        self.orderIndex = -1  # Position in order while showing found ones
+        self.filter = (None,) * 5  # Offensive, lang, path, shortmax and
+                                   # longmin of the cookies shown
+        self.view = None  # Cookies that pass the filter; None for all
+        self.loading = False  # Whether the loader is adding files
+        self.searchIndex = None  # Built on the first search
+        self.statics = {}
+        self.fileKeys = {}  # Path: corpuscache.fileKey when it was loaded
+
+        self.savebase = SAVE_BASE
+        self.savefile = SAVE_FILE
+        try:
+            self.favorites = favorites.Favorites(FAVORITES_DB)
+            if not len(self.favorites) and os.path.isfile(self.savefile):
+                self.favorites.importFile(self.savefile)  # Older versions
+        except (OSError, sqlite3.Error):
+            self.favorites = None
+        self.cachedir = CACHE_DIR
+
+        self.nepigrams = 0
+        self.cookie = ""
+        self.cookieHash = hash(self.cookie)
+
+        # Many changes in a row, as holding a key, make a single refresh
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.setInterval(0)
+        self.refreshTimer.timeout.connect(self.refreshInterface)
+
+        # Changed files are reloaded once they are quiet for a while, so
+        # copying many files makes a single reload
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.fileChanged)
+        self.watcher.fileChanged.connect(self.fileChanged)
+        self.reloadTimer = QTimer(self)
+        self.reloadTimer.setSingleShot(True)
+        self.reloadTimer.setInterval(1000)
+        self.reloadTimer.timeout.connect(self.reloadFiles)
+
+        # The clipboard is only asked when it changes, not on every cookie
+        self.clipboardHash = None
+        QApplication.clipboard().dataChanged.connect(self.clipboardChanged)
+        self.clipboardChanged()
+
+        self.statusOrigin = QLabel()
+        self.statusOffensive = QLabel()
+        self.statusSaved = QLabel()
+        self.statusCopied = QLabel()
+
+        self.numberModel = NumberModel(self)
+        self.comboGoTo = QComboBox()
+        self.comboGoTo.setModel(self.numberModel)
+        self.comboGoTo.view().setUniformItemSizes(True)
+        self.comboGoTo.setEditable(True)
+        self.comboGoTo.setInsertPolicy(QComboBox.NoInsert)
+        self.comboGoTo.setSizeAdjustPolicy(
+            QComboBox.AdjustToMinimumContentsLengthWithIcon)
+        self.setGoToRange()
+        self.comboGoTo.currentIndexChanged[str].connect(self.goToComboIndex)
+
+        self.searchBox = QLineEdit()
+        self.searchBox.setPlaceholderText(_("Search"))
+        self.searchBox.setClearButtonEnabled(True)
+        self.searchBox.setMaximumWidth(200)
+        self.searchBox.returnPressed.connect(self.searchCookies)
+        self.searchBox.textChanged.connect(self.searchChanged)
+
+        self.index = -1
+
+        self.textEdit = QTextEdit()
+        self.textEdit.setReadOnly(True)
+        self.setCentralWidget(self.textEdit)
+        self.blank = QTextDocument(self)
+        self.renderCache = RenderCache(self.textEdit)
+
+        # The cookies around the shown one are laid out while idle
+        self.prefetching = []  # Positions of elist to lay out
+        self.prefetchTimer = QTimer(self)
+        self.prefetchTimer.setSingleShot(True)
+        self.prefetchTimer.setInterval(0)
+        self.prefetchTimer.timeout.connect(self.prefetch)
+
+        self.createActions()
+        self.createMenus()
+        self.createToolBars()
+        self.createStatusBar()
+
+        self.readSettings()
+        self.profile.mark("widgets")
+
+        self.loadDir()  # Shows a cookie when the first file is loaded
+
+    def loadDir(self):
+        ''' Starts loading all the cookie files in background '''
+        favorites = [(self.savefile, None, False, True)]
+
+        self.statusBar().showMessage(_("Loading cookies..."))
+        if self.db:
+            if self.index < 0:  # What was imported before, while importing
+                self.setOrder()
+                if self.nepigrams:
+                    self.nextCookie()
+            self.loader = DBLoader(FORTUNE_DIRS, favorites + self.opened,
+                                   self.cachedir, self.db, self.profile, self)
+        else:
+            self.loader = Loader(FORTUNE_DIRS, favorites, self.cachedir,
+                                 self.profile, self)
+            self.loader.loaded.connect(self.addFile)
+        self.loader.finished.connect(self.loadFinished)
+        self.loading = True
+        self.loader.start()
+
+    def loadFinished(self):
+        self.statusBar().clearMessage()
+        self.loading = False
+        if self.db and self.loader.changed:
+            self.storeChanged()
+        elif not self.db and self.view is not None:
+            self.restart(self.elist[self.index] if self.index >= 0
+                         else None)  # The view of all the files
+        self.watchFiles()
+        if self.reloadTimer.isActive():
+            self.reloadTimer.start()  # Changed while loading
+        if not self.nepigrams:
+            self.noCookies()
+
+    def watchFiles(self):
+        ''' Watches the cookie directories and the loaded files '''
+        dirs = [d[0] for d in cookiestore.cookieDirs(FORTUNE_DIRS)]
+        loaded = [f[0] for f in self.store.files if f[0] is not None]
+        paths = [p for p in FORTUNE_DIRS + dirs + [self.savebase] + loaded
+                 if os.path.exists(p)]
+        watched = set(self.watcher.files() + self.watcher.directories())
+        paths = [p for p in paths if p not in watched]
+        if paths:
+            self.watcher.addPaths(paths)
+
+    def fileChanged(self, path):
+        fileid = None if self.db else self.store.fileId(path)
+        if fileid is not None:
+            self.store.closeMap(fileid)  # Its old map may be past its end
+        self.reloadTimer.start()  # Waits again for a quiet moment
+
+    def reloadFiles(self):
+        ''' Reads again the files that changed, takes out the removed ones
+        and adds the new ones. The other files are left as they are. '''
+        if self.loader.isRunning():
+            self.reloadTimer.start()  # Not before loading ends
+            return
+        if self.db:
+            self.loadDir()  # Only what changed is imported
+            return
+        found = [f + (False,) for f in cookiestore.findFiles(FORTUNE_DIRS)]
+        found.append((self.savefile, None, False, True))
+        keys = {}
+        for path in [f[0] for f in found] + list(self.statics):
+            try:
+                keys[path] = corpuscache.fileKey(path)
+            except OSError:
+                pass
+        tree = tuple(os.path.join(base, "") for base in FORTUNE_DIRS)
+        paths = set(f[0] for f in found)
+        changed = [p for p in self.statics if keys.get(p) != self.fileKeys[p]
+                   or (p.startswith(tree) and p not in paths)]
+        new = [f for f in found if f[0] in keys
+               and (f[0] not in self.statics or f[0] in changed)]
+        if not changed and not new:
+            return
+
+        for path in changed:
+            self.removeFile(path)
+        for loaded in cookiestore.loadFiles(new, self.cachedir):
+            self.addFile(*loaded)
+        self.watchFiles()
+
+        if not self.nepigrams:
+            self.index = -1
+            self.clearCookie()
+            return
+        self.index = min(max(self.index, 0), self.nepigrams - 1)
+        self.showCookie()
+        self.statusBar().showMessage(_("Cookies reloaded"), 3000)
+
+    def loadFile(self, path, lang=None, offensive=False, saved=False):
+        ''' Adds a cookie file to the store. Only its offset table is
+        read; the cookies are read when shown. '''
+        if not os.path.isfile(path):
+            return(1)
+        if self.db:
+            self.opened.append((path, lang, offensive, saved))
+            if not self.loader.isRunning():
+                self.loadDir()
+            else:
+                self.reloadTimer.start()  # Once this import ends
+            return
+
+        try:
+            table = packfile.load(path, os.path.join(self.cachedir, "dat"),
+                                  offensive)
+        except OSError:
+            return(1)
+        self.addFile(path, table, lang, offensive, saved)
+
+    def addFile(self, path, table, lang=None, offensive=False, saved=False):
+        ''' Adds the cookies of an indexed file to the store. The cookies
+        already shown keep their places in the navigation order. '''
+        first = self.store.addFile(path, table, lang, offensive, saved)
+        self.statics.update({path: (table.numstr, offensive)})
+        try:
+            self.fileKeys[path] = corpuscache.fileKey(path)
+        except OSError:
+            self.fileKeys[path] = None
+        if self.searchIndex:
+            fileid = len(self.store.files) - 1
+            self.searchIndex.addFile(fileid, search.loadFileIndex(
+                self.store, fileid, self.cachedir))
+        if self.view is None:
+            self.setOrder()
+        elif not (self.loading and len(self.view)):
+            self.makeView()  # While loading, only until there is a cookie
+            self.setOrder()
+
+        if self.index < 0:
+            if self.nepigrams:
+                self.nextCookie()  # Starts showing a cookie
+        else:
+            self.updateInterface()
+
+    def removeFile(self, path):
+        ''' Takes the cookies of a file out of the store. The cookies
+        already shown keep their places in the navigation order. '''
+        fileid = self.store.fileId(path)
+        if fileid is None:
+            return
+        moved = self.store.removeFile(fileid)
+        del self.statics[path]
+        del self.fileKeys[path]
+        if self.searchIndex:
+            self.searchIndex.removeFile(fileid)
+
+        if self.view is None:
+            seen = {}
+            for p, x in self.seen.items():
+                x = moved.get(x, x)
+                if x is not None:
+                    seen[p] = x
+            self.seen = seen
+        else:
+            self.seen = {}  # Places in a view that is made again
+            self.makeView()
+        if self.elist is not self.order:
+            self.elist = self.store.originals(self.elist)
+        self.setOrder()
+
+    def setOrder(self):
+        ''' Makes the navigation order again after files are added or
+        removed, or the filter changes '''
+        searching = self.elist is not self.order
+        view = self.store.unique if self.view is None else self.view
+        self.order = selection.Mapped(
+            selection.Permutation(len(view), self.seed, self.seen), view)
+        if not searching:
+            self.elist = self.order
+        self.nepigrams = len(self.elist)
+        self.setGoToRange()
+
+    def makeView(self):
+        ''' Joins the views of the files that pass the filter '''
+        offensive, lang, path, shortmax, longmin = self.filter
+        if self.filter == (None,) * 5:
+            self.view = None
+        else:
+            self.view = self.store.view(
+                self.store.selectFiles(offensive, lang, path), shortmax,
+                longmin)
+
+    def setFilter(self, offensive=None, lang=None, path=None, shortmax=None,
+                  longmin=None):
+        ''' Navigates only the cookies of the files that match, with the
+        length limits of cookiestore.fitsLength. The cookie shown goes
+        first if it passes. '''
+        n = self.elist[self.index] if self.nepigrams else None
+        self.filter = (offensive, lang, path, shortmax, longmin)
+        self.restart(n)
+        self.updateFilterMenu()
+
+    def storeChanged(self):
+        ''' Reads the files of the database again after an import. The
+        cookie shown stays first if it is still there. '''
+        n = self.elist[self.index] if self.nepigrams and self.index >= 0 \
+            else None
+        self.store.refresh()
+        self.restart(n)
+
+    def restart(self, n):
+        ''' Makes the view and the navigation order again, with cookie n
+        first if it passes the filter '''
+        searching = self.elist is not self.order
+        self.makeView()
+        view = self.store.unique if self.view is None else self.view
+        try:
+            self.seen = {0: view.index(n)} if n is not None else {}
+        except ValueError:
+            self.seen = {}  # Filtered out
+        self.elist = self.order  # Not searching until searched again
+        self.setOrder()
+        self.index = -1
+        self.orderIndex = -1
+        if searching:
+            self.searchCookies()
+        if self.index < 0:
+            if self.nepigrams:
+                self.nextCookie()
+            else:
+                self.clearCookie()
+                self.statusBar().showMessage(_("No cookies found"), 3000)
+
+    def filterTriggered(self, action):
+        offensive, lang, path, shortmax, longmin = self.filter
+        kind, value = action.data()
+        if kind == "offensive":
+            offensive = value
+        elif kind == "lang":
+            lang = value
+        elif kind == "length":
+            shortmax, longmin = value
+        else:
+            path = value
+        self.setFilter(offensive, lang, path, shortmax, longmin)
+
+    def updateFilterMenu(self):
+        ''' Lists the languages and files loaded in the Filter menu '''
+        offensive, lang, path, shortmax, longmin = self.filter
+        for act in self.offensiveGroup.actions():
+            act.setChecked(act.data()[1] == offensive)
+        for act in self.lengthGroup.actions():
+            act.setChecked(act.data()[1] == (shortmax, longmin))
+
+        self.langMenu.clear()
+        for act in self.langGroup.actions():
+            self.langGroup.removeAction(act)
+        for value in [None] + self.store.langs():
+            act = self.langMenu.addAction(value or _("All languages"))
+            act.setCheckable(True)
+            act.setChecked(value == lang)
+            act.setData(("lang", value))
+            self.langGroup.addAction(act)
+
+        self.sourceMenu.clear()
+        for act in self.sourceGroup.actions():
+            self.sourceGroup.removeAction(act)
+        paths = sorted(f[0] for f in self.store.files if f[0] is not None)
+        for value in [None] + paths:
+            act = self.sourceMenu.addAction(
+                os.path.basename(value) if value else _("All files"))
+            act.setCheckable(True)
+            act.setChecked(value == path)
+            act.setData(("path", value))
+            if value:
+                act.setStatusTip(value)
+            self.sourceGroup.addAction(act)
+
+    def setGoToRange(self):
+        ''' Makes comboGoTo offer one number for each cookie '''
+        self.comboGoTo.blockSignals(True)  # Its index is set by the caller
+        self.numberModel.setCount(self.nepigrams)
+        self.comboGoTo.blockSignals(False)
+        self.comboGoTo.setValidator(QIntValidator(1, max(self.nepigrams, 1),
+                                                  self.comboGoTo))
+        self.comboGoTo.setMinimumContentsLength(len(str(self.nepigrams)) + 1)
+
+    def goToComboIndex(self):
+        i = self.comboGoTo.currentIndex()
+        if i == self.index or not 0 <= i < self.nepigrams:
+            return
+        self.index = i
+        self.showCookie()
+
+    def firstCookie(self):
+        self.index = 0
+        self.showCookie()
+
+    def lastCookie(self):
+        self.index = self.nepigrams - 1
+        self.showCookie()
+
+    def nextCookie(self):
+        self.index += 1
+        if self.index >= self.nepigrams:
+            self.index = 0  # Go to the beginning
+        self.showCookie()
+
+    def prevCookie(self):
+        self.index -= 1
+        if self.index < 0:
+            self.index = self.nepigrams - 1  # Go to the end
+        self.showCookie()
+
+    def searchCookies(self):
+        ''' Navigates only the cookies with all the words of the search box.
+        An empty search goes back to all the cookies. '''
+        query = self.searchBox.text().strip()
+        if not query:
+            self.showAll()
+            return
+        if self.searchIndex is None:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            if self.db:
+                self.searchIndex = corpusdb.TextSearch(self.store)
+            else:
+                self.searchIndex = search.SearchIndex(self.store,
+                                                      self.cachedir)
+            QApplication.restoreOverrideCursor()
+
+        found = self.store.originals(self.searchIndex.find(query))
+        if self.view is not None:
+            view = self.view if self.db else set(self.view)  # Lookups
+            found = [n for n in found if n in view]
+        if not found:
+            self.statusBar().showMessage(_("No cookies found"), 3000)
+            return
+        if self.elist is self.order:
+            self.orderIndex = self.index
+        self.elist = found
+        self.nepigrams = len(found)
+        self.setGoToRange()
+        self.statusBar().showMessage(str(len(found)) + " "
+                                     + _("cookies found"), 3000)
+        self.firstCookie()
+
+    def searchChanged(self, text):
+        if not text:
+            self.showAll()
+
+    def showAll(self):
+        if self.elist is self.order:
+            return
+        self.elist = self.order
+        self.nepigrams = len(self.order)
+        self.setGoToRange()
+        self.index = min(max(self.orderIndex, 0), self.nepigrams - 1)
+        self.showCookie()
+
+    def focusSearch(self):
+        self.searchBox.setFocus()
+        self.searchBox.selectAll()
+
+    def saveCookie(self):
+        if self.isSaved()[0]:
+            self.changeFavorites(self.favorites.add, self.cookie,
+                                 self.store.path(self.elist[self.index]))
+        self.updateInterface()
+
+    def unsaveCookie(self):
+        if not self.isSaved()[0]:
+            self.changeFavorites(self.favorites.remove, self.cookie)
+        self.updateInterface()
+
+    def changeFavorites(self, change, *args):
+        ''' Applies a change to the favorites and exports them '''
+        if self.favorites is None:
+            QMessageBox.warning(self, _("Warning"),
+                                _("I can not create the directory:")
+                                + " <p><pre>" + self.savebase
+                                + "</pre>")
+            return(1)
+        try:
+            change(*args)
+        except sqlite3.Error:
+            QMessageBox.warning(self, _("Warning"),
+                                _("I can not write the file:")
+                                + " <p><pre>" + FAVORITES_DB
+                                + "</pre>")
+            return(1)
+        try:
+            self.favorites.export(self.savefile)
+        except PermissionError:
+            QMessageBox.warning(self, _("Warning"),
+                                _("No permission to write the file:")
+                                + " <p><pre>" + self.savefile
+                                + "</pre>")
+            return(1)
+        except OSError:
+            QMessageBox.warning(self, _("Warning"),
+                                _("I can not write the file:")
+                                + " <p><pre>" + self.savefile
+                                + "</pre>")
+            return(1)
+
+    def copyCookie(self):
+        self.textEdit.selectAll()
+        self.textEdit.copy()
+        self.textEdit.clearFocus()
+        self.updateInterface()
+
+    def about(self):
+        aboutdialog.show()
+
+    def statistics(self):
+        if self.statsDialog is None:
+            self.statsDialog = StatsDialog(self)
+        self.statsDialog.show()
+        self.statsDialog.raise_()
+
+    def isSaved(self):
+        ''' Returns status, text and abbreviation '''
+        if self.favorites is not None and self.cookie in self.favorites:
+            return((False, _("Saved")))
+        return((True, _("Unsaved")))
+
+    def isOffensive(self):
+        ''' Returns status, text and abbreviation '''
+        n = self.elist[self.index]
+        if any(self.store.isOffensive(c)
+               for c in self.store.copies.get(self.store.cid[n], [n])):
+            return((True, _("Offensive")))
+        return((False, ""))
+
+    def isCopied(self):
+        if self.clipboardHash == self.cookieHash:
+            return((True, _("Copied")))
+        return((False, ""))
+
+    def clipboardChanged(self):
+        self.clipboardHash = hash(QApplication.clipboard().text())
+        self.updateInterface()
+
+    def isFirst(self):
+        if self.index == 0:
+            return(True)
+        return(False)
+
+    def isLast(self):
+        if self.index == self.nepigrams - 1:
+            return(True)
+        return(False)
+
+    def updateStatus(self):
+        paths = self.store.sources(self.elist[self.index])
+        origin = _("From:") + " " + ", ".join(os.path.basename(p)
+                                              for p in paths)
+        offensive = self.isOffensive()[1]
+        saved = self.isSaved()[1]
+        copied = self.isCopied()[1]
+        self.statusOrigin.setText(origin)
+        self.statusOrigin.setToolTip("\n".join(paths))
+        self.statusOffensive.setText(offensive)
+        self.statusSaved.setText(saved)
+        self.statusCopied.setText(copied)
+
+    def updateInterface(self):
+        ''' Refreshes the interface when the event loop is free '''
+        self.refreshTimer.start()
+
+    def refreshInterface(self):
+        if not self.nepigrams:
+            return  # Still loading
+        if self.favorites is not None:
+            self.favorites.refresh()
+        if self.comboGoTo.currentIndex() != self.index:
+            self.comboGoTo.blockSignals(True)  # Not shown again
+            self.comboGoTo.setCurrentIndex(self.index)
+            self.comboGoTo.blockSignals(False)
+        self.firstAct.setEnabled(not self.isFirst())
+        self.prevAct.setEnabled(not self.isFirst())
+
+        self.lastAct.setEnabled(not self.isLast())
+        self.nextAct.setEnabled(not self.isLast())
+
+        self.copyAct.setEnabled(not self.isCopied()[0])
+        self.saveAct.setEnabled(self.isSaved()[0])
+        self.unsaveAct.setEnabled(not self.isSaved()[0])
+
+        self.updateStatus()
+
+    def noCookies(self):
+        t = _("There is no cookies!")
+        q = _("Do you want to add some ones?")
+        txt = t + "<p>" + q
+        reply = QMessageBox.question(self, _("Question"), txt,
+                                     QMessageBox.Yes | QMessageBox.No,
+                                     QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            select = QFileDialog.getOpenFileName(self, 'Open file',
+                                               '/usr/share/games/fortunes')
+            self.loadFile(select[0], None, False, True)  # lang, offensive, saved
+            #self.loadFile('/usr/share/games/fortunes/fortunes', None, False, True)
+            if not self.nepigrams:
+                self.noCookies()  # Nothing loaded, ask again
+        else:
+            sys.exit()
+
+    def showCookie(self):
+        if not self.nepigrams:
+            return  # Still loading
+        start = time.perf_counter()
+        n = self.elist[self.index]
+        if self.elist is self.order:
+            self.seen[self.index] = self.order.indexes[self.index]
+        self.cookie = self.store.text(n)
+        self.cookieHash = hash(self.cookie)
+        self.textEdit.setDocument(self.renderCache.document(n, self.cookie))
+        self.updateInterface()
+        self.profile.addLatency(time.perf_counter() - start)
+        if "first cookie" not in self.profile.marks:
+            self.profile.mark("first cookie")
+            QTimer.singleShot(0, lambda: self.profile.mark("first paint"))
+
+        self.prefetching = []
+        for i in [self.index + d * s for d in range(1, 5) for s in (1, -1)
+                  ] + [0, self.nepigrams - 1]:
+            i %= self.nepigrams
+            if i != self.index and i not in self.prefetching:
+                self.prefetching.append(i)
+        self.prefetchTimer.start()
+
+    def prefetch(self):
+        ''' Lays out the next cookie around the shown one that is not
+        ready, and waits for the next idle moment for the rest '''
+        while self.prefetching:
+            i = self.prefetching.pop(0)
+            if i >= self.nepigrams:
+                continue
+            n = self.elist[i]
+            if n not in self.renderCache:
+                self.renderCache.document(n, self.store.text(n))
+                break
+        if self.prefetching:
+            self.prefetchTimer.start()
+
+    def clearCookie(self):
+        self.cookie = ""
+        self.cookieHash = hash(self.cookie)
+        self.textEdit.setDocument(self.blank)
+
+    def createActions(self):
+        self.firstAct = QAction(QIcon.fromTheme('go-first'),
+                                _("&First"),
+                                self, shortcut=QKeySequence.MoveToStartOfLine,
+                                statusTip=_("Show first cookie"),
+                                triggered=self.firstCookie)
+
+        self.lastAct = QAction(QIcon.fromTheme('go-last'),
+                               _("&Last"),
+                               self, shortcut=QKeySequence.MoveToEndOfLine,
+                               statusTip=_("Show last cookie"),
+                               triggered=self.lastCookie)
+
+        self.nextAct = QAction(QIcon.fromTheme('go-next'),
+                               _("&Next"),
+                               self, shortcut=QKeySequence.MoveToNextPage,
+                               statusTip=_("Show next cookie"),
+                               triggered=self.nextCookie)
+
+        self.prevAct = QAction(QIcon.fromTheme('go-previous'),
+                               _("&Previous"),
+                               self, shortcut=QKeySequence.MoveToPreviousPage,
+                               statusTip=_("Show previous cookie"),
+                               triggered=self.prevCookie)
+
+        self.saveAct = QAction(QIcon.fromTheme('document-save'), _("&Save"),
+                               self, shortcut=QKeySequence.Save,
+                               statusTip=_("Save cookie to favorites"),
+                               triggered=self.saveCookie)
+
+        self.unsaveAct = QAction(QIcon.fromTheme('edit-delete'),
+                                 _("&Unsave"),
+                                 self, statusTip=_("Remove cookie from"
+                                                   " favorites"),
+                                 triggered=self.unsaveCookie)
+
+        self.exitAct = QAction(QIcon.fromTheme('window-close'), _("E&xit"),
+                               self, shortcut=QKeySequence.Quit,
+                               statusTip=_("Exit the application"),
+                               triggered=self.close)
+
+        self.copyAct = QAction(QIcon.fromTheme('edit-copy'),
+                               _("&Copy"),
+                               self, shortcut=QKeySequence.Copy,
+                               statusTip=_("Copy cookie to the clipboard"),
+                               triggered=self.copyCookie)
+
+        self.aboutAct = QAction(QIcon.fromTheme(EXECUTABLE_NAME),
+                                _("&About") + " " + PROGRAM_NAME, self,
+                                statusTip=_("Information about"
+                                            " this application"),
+                                triggered=self.about)
+
+        self.aboutQtAct = QAction(QIcon.fromTheme('help-about'),
+                                  _("About &Qt"), self,
+                                  statusTip=_("Show information about"
+                                              " the Qt library"),
+                                  triggered=QApplication.instance().aboutQt)
+
+        self.statsAct = QAction(QIcon.fromTheme('utilities-system-monitor'),
+                                _("&Statistics"), self,
+                                statusTip=_("Show how long loading and"
+                                            " showing cookies take"),
+                                triggered=self.statistics)
+
+        self.findAct = QAction(QIcon.fromTheme('edit-find'),
+                               _("&Find"),
+                               self, shortcut=QKeySequence.Find,
+                               statusTip=_("Search cookies by their words"),
+                               triggered=self.focusSearch)
+
+        self.openAct = QAction(QIcon.fromTheme('document-open'),
+                               _("&Open"),
+                               self, shortcut=QKeySequence.Open,
+                               statusTip=_("Open a cookie file"),
+                               triggered=self.loadFile)
+        for act in (self.firstAct, self.lastAct, self.nextAct, self.prevAct,
+                    self.saveAct, self.unsaveAct, self.copyAct):
+            act.setEnabled(False)  # Until a cookie is shown
+
+    def createMenus(self):
+        self.fileMenu = self.menuBar().addMenu(_("&File"))
+        self.fileMenu.addAction(self.openAct)
+        self.fileMenu.addAction(self.copyAct)
+        self.fileMenu.addAction(self.saveAct)
+        self.fileMenu.addAction(self.unsaveAct)
+        self.fileMenu.addSeparator()
+        self.fileMenu.addAction(self.exitAct)
+
+        self.editMenu = self.menuBar().addMenu(_("&Navigation"))
+        self.editMenu.addAction(self.prevAct)
+        self.editMenu.addAction(self.nextAct)
+        self.editMenu.addAction(self.firstAct)
+        self.editMenu.addAction(self.lastAct)
+        self.editMenu.addSeparator()
+        self.editMenu.addAction(self.findAct)
+
+        self.filterMenu = self.menuBar().addMenu(_("F&ilter"))
+        self.filterMenu.aboutToShow.connect(self.updateFilterMenu)
+        self.offensiveMenu = self.filterMenu.addMenu(_("&Offensive"))
+        self.offensiveGroup = QActionGroup(self)
+        for text, value in ((_("&All cookies"), None),
+                            (_("&Not offensive"), False),
+                            (_("&Only offensive"), True)):
+            act = self.offensiveMenu.addAction(text)
+            act.setCheckable(True)
+            act.setData(("offensive", value))
+            self.offensiveGroup.addAction(act)
+        self.lengthMenu = self.filterMenu.addMenu(_("Len&gth"))
+        self.lengthGroup = QActionGroup(self)
+        for text, value in ((_("&Any length"), (None, None)),
+                            (_("&Short, up to %d bytes") % SHORT_LENGTH,
+                             (SHORT_LENGTH, None)),
+                            (_("&Long, more than %d bytes") % SHORT_LENGTH,
+                             (None, SHORT_LENGTH))):
+            act = self.lengthMenu.addAction(text)
+            act.setCheckable(True)
+            act.setData(("length", value))
+            self.lengthGroup.addAction(act)
+        self.langMenu = self.filterMenu.addMenu(_("&Language"))
+        self.langGroup = QActionGroup(self)
+        self.sourceMenu = self.filterMenu.addMenu(_("&File"))
+        self.sourceGroup = QActionGroup(self)
+        for group in (self.offensiveGroup, self.lengthGroup, self.langGroup,
+                      self.sourceGroup):
+            group.triggered.connect(self.filterTriggered)
+
+        self.helpMenu = self.menuBar().addMenu(_("&Help"))
+        self.helpMenu.addAction(self.statsAct)
+        self.helpMenu.addSeparator()
+        self.helpMenu.addAction(self.aboutAct)
+        self.helpMenu.addAction(self.aboutQtAct)
+
+    def createToolBars(self):
+        self.fileToolBar = self.addToolBar(_("File"))
+        self.fileToolBar.addAction(self.openAct)
+        self.fileToolBar.addAction(self.saveAct)
+        self.fileToolBar.addAction(self.unsaveAct)
+        self.fileToolBar.addAction(self.copyAct)
+
+        self.navToolBar = self.addToolBar(_("Navigation"))
+        self.navToolBar.addAction(self.firstAct)
+        self.navToolBar.addAction(self.prevAct)
+        self.navToolBar.addAction(self.nextAct)
+        self.navToolBar.addAction(self.lastAct)
+        self.navToolBar.addWidget(self.comboGoTo)
+
+        self.searchToolBar = self.addToolBar(_("Search"))
+        self.searchToolBar.addWidget(self.searchBox)
+
+    def createStatusBar(self):
+        self.statusBar().addWidget(self.statusOrigin, Qt.AlignLeft)
+        self.statusBar().addWidget(self.statusOffensive, Qt.AlignRight)
+        self.statusBar().addWidget(self.statusSaved, Qt.AlignRight)
+        self.statusBar().addWidget(self.statusCopied, Qt.AlignRight)
+
+    def closeEvent(self, event):
+        self.loader.requestInterruption()
+        self.loader.wait()
+        super(MainWindow, self).closeEvent(event)
+
+    def readSettings(self):
+        settings = QSettings(PROGRAM_NAME, _("Settings"))
+        size = settings.value("size", QSize(400, 300))
+        self.setWindowTitle(PROGRAM_NAME)
+        self.setWindowIcon(QIcon.fromTheme(EXECUTABLE_NAME))
+        self.resize(size)
+
+
+class StatsDialog(QWidget):
+    ''' Files, load phases, memory and latency of a MainWindow '''
+    def __init__(self, mainwindow):
+        super(StatsDialog, self).__init__(mainwindow, Qt.Window)
+        self.mainwindow = mainwindow
+        self.report = None
+
+        self.text = QTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setLineWrapMode(QTextEdit.NoWrap)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+
+        refresh = QPushButton(_("Refresh"), self)
+        refresh.setIcon(QIcon.fromTheme("view-refresh"))
+        refresh.clicked.connect(self.refresh)
+        save = QPushButton(_("Save as JSON"), self)
+        save.setIcon(QIcon.fromTheme("document-save-as"))
+        save.clicked.connect(self.save)
+        btn = QPushButton(_("Close"), self)
+        btn.setIcon(QIcon.fromTheme("window-close"))
+        btn.clicked.connect(self.close)
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(refresh)
+        buttonLayout.addWidget(save)
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(btn)
+
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(self.text)
+        mainLayout.addLayout(buttonLayout)
+        self.setLayout(mainLayout)
+
+        self.setWindowTitle(_("Statistics") + " - " + PROGRAM_NAME)
+        self.resize(720, 480)
+
+    def showEvent(self, event):
+        self.refresh()
+        super(StatsDialog, self).showEvent(event)
+
+    def refresh(self):
+        self.report = self.mainwindow.profile.report(self.mainwindow.store)
+        self.text.setPlainText(profiling.formatReport(self.report))
+
+    def save(self):
+        path = QFileDialog.getSaveFileName(self, _("Save statistics"),
+                                           EXECUTABLE_NAME + "-stats.json",
+                                           "JSON (*.json)")[0]
+        if not path:
+            return
+        try:
+            with open(path, "w") as f:
+                json.dump(self.report, f, indent=2)
+        except OSError as e:
+            QMessageBox.warning(self, _("Warning"), str(e))
+
+
+class AboutDialog(QWidget):
+    def __init__(self, parent=None):
+        super(AboutDialog, self).__init__(parent)
+
+        font = QFont()
+        font.setPointSize(18)
+        font.setBold(False)
+        labelIcon = QLabel()
+        pixmap = QIcon.fromTheme(EXECUTABLE_NAME).pixmap(QSize(64, 64))
+        labelIcon.setPixmap(pixmap)
+        labelText = QLabel(PROGRAM_NAME)
+        labelText.setFont(font)
+
+        tabWidget = QTabWidget()
+        tabWidget.addTab(AboutTab(), _("About"))
+        tabWidget.addTab(VersionTab(), _("Version"))
+        tabWidget.addTab(AuthorsTab(), _("Authors"))
+        tabWidget.addTab(ThanksTab(), _("Thanks"))
+        tabWidget.addTab(TranslationTab(), _("Translation"))
+
+        btn = QPushButton(_("Close"), self)
+        btn.setIcon(QIcon.fromTheme("window-close"))
+        btn.setToolTip(_("Close this window"))
+        btn.clicked.connect(self.close)
+
+        labelLayout = QHBoxLayout()
+        labelLayout.addWidget(labelIcon)
+        labelLayout.addWidget(labelText, Qt.AlignLeft)
+
+        mainLayout = QGridLayout()
+        mainLayout.addLayout(labelLayout, 0, 0)
+        mainLayout.addWidget(tabWidget, 1, 0)
+        mainLayout.addWidget(btn, 2, 0, Qt.AlignRight)
+        self.setLayout(mainLayout)
+
+        self.setWindowTitle(_("About") + " " + PROGRAM_NAME)
+        self.setWindowIcon(QIcon.fromTheme(EXECUTABLE_NAME))
+
+
+class AboutTab(QWidget):
+    def __init__(self, parent=None):
+        super(AboutTab, self).__init__(parent)
+
+        blank = QLabel()
+        description = QLabel(DESCRIPTION)
+        copyright = QLabel("© 2017, " + AUTHOR)
+        source = QLabel(_("Source:") + " "
+                        + "<a href='" + SOURCE + "'>" + SOURCE + "</a>")
+        license = QLabel(_("License:") + " "
+                         + "<a href='https://www.gnu.org/licenses/"
+                         "gpl-3.0.en.html'>"
+                         + _("GNU General Public License, version 3") + "</a>")
+
+        source.setTextInteractionFlags(Qt.TextBrowserInteraction)
+
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(blank)
+        mainLayout.addWidget(blank)
+        mainLayout.addWidget(blank)
+        mainLayout.addWidget(description)
+        mainLayout.addWidget(blank)
+        mainLayout.addWidget(copyright)
+        mainLayout.addWidget(source)
+        mainLayout.addWidget(license)
+        mainLayout.addStretch()
+        self.setLayout(mainLayout)
+
+
+class VersionTab(QWidget):
+    def __init__(self, parent=None):
+        super(VersionTab, self).__init__(parent)
+
+        version = QLabel("<b>" + _("Version") + " " + VERSION + "<b>")
+        using = QLabel(_("Using:") + " ")
+        pyver = ".".join((
+            str(sys.version_info[0]),
+            str(sys.version_info[1]),
+            str(sys.version_info[2])))
+        python = QLabel("<ul><li>Python " + pyver)
+        pyqt = QLabel("<ul><li>PyQt " + QT_VERSION_STR)
+
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(version)
+        mainLayout.addWidget(using)
+        mainLayout.addWidget(python)
+        mainLayout.addWidget(pyqt)
+        mainLayout.addStretch(1)
+        self.setLayout(mainLayout)
+
+
+class AuthorsTab(QWidget):
+    def __init__(self, parent=None):
+        super(AuthorsTab, self).__init__(parent)
+
+        blank = QLabel()
+        notice = QLabel(_("Mail me if you found bugs."))
+        name1 = QLabel("<b>" + AUTHOR + "<b>")
+        task1 = QLabel("<i>" + _("Principle author") + "</i>")
+        mail1 = QLabel("<pre>" + MAIL + "</pre>")
+
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(notice)
+        mainLayout.addWidget(blank)
+        mainLayout.addWidget(name1)
+        mainLayout.addWidget(task1)
+        mainLayout.addWidget(mail1)
+        mainLayout.addStretch(1)
+        self.setLayout(mainLayout)
+
+
+class ThanksTab(QWidget):
+    def __init__(self, parent=None):
+        super(ThanksTab, self).__init__(parent)
+
+        blank = QLabel()
+        notice = QLabel(_("Thank you for using my program."))
+
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(blank)
+        mainLayout.addWidget(notice)
+        mainLayout.addStretch(1)
+        self.setLayout(mainLayout)
+
+
+class TranslationTab(QWidget):
+    def __init__(self, parent=None):
+        super(TranslationTab, self).__init__(parent)
+
+        blank = QLabel()
+        notice = QLabel(_("Please, mail me if you want to") + " "
+                        + _("improve the translation."))
+        name1 = QLabel("<b>" + AUTHOR + "<b>")
+        task1 = QLabel("<i>" + _("Spanish and english translation") + "</i>")
+        mail1 = QLabel("<pre>" + MAIL + "</pre>")
+
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(notice)
+        mainLayout.addWidget(blank)
+        mainLayout.addWidget(name1)
+        mainLayout.addWidget(task1)
+        mainLayout.addWidget(mail1)
+        mainLayout.addStretch(1)
+        self.setLayout(mainLayout)
+
+
+def main(argv, db=None):
+    global aboutdialog
+
+    app = QApplication(argv)
+    mainWin = MainWindow(db)
+    aboutdialog = AboutDialog()
+    mainWin.show()
+    return(app.exec_())